@@ -0,0 +1,129 @@
+"""Lemmatizes whole texts with the lemmatization table, eg. every paragraph of a book.
+
+  python batch_lemmatizer.py --table table.idx --input book.txt --output lemmas.jsonl --workers 4
+
+Texts are split into tokens, runs of letters, and every token is looked up lowercased, the same way
+forms are lowercased when the table is built, as {pos: lemma} (None for tokens which aren't in the
+table). The table is either the binary index from --lemmatization-index, which is memory-mapped so
+every worker process shares it, or the JSON Lines table, which each process loads into a dict.
+
+Word frequencies in text are very skewed, so lookups go through an LRU cache on the token as it's
+written, which also saves lowercasing it again. Cached results are shared: don't modify the dicts.
+
+With more than one worker, documents are sent to a process pool in batches of about BATCH_SIZE
+characters and results come back in the same order as the documents.
+"""
+
+import argparse
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import json_codec
+from compressed_io import open_input, open_output
+from lemmatizer import MAGIC, Lemmatizer, load_jsonl_table
+from scheduler import run_ahead
+
+# letters only, so numbers and punctuation aren't looked up
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+")
+CACHE_SIZE = 200000
+BATCH_SIZE = 1024 * 1024
+
+
+def open_table(path):
+  """A function which looks a lowercase form up in the table at path, a binary index or JSON Lines."""
+  with open(path, 'rb') as file:
+    is_index = file.read(len(MAGIC)) == MAGIC
+  if is_index:
+    return Lemmatizer(path).lookup
+  return load_jsonl_table(path).get
+
+
+class BatchLemmatizer:
+  def __init__(self, table_path, cache_size=CACHE_SIZE):
+    lookup = open_table(table_path)
+    # the table only has lowercase forms
+    self.lookup = lambda token: lookup(token.lower())
+    if cache_size:
+      self.lookup = lru_cache(maxsize=cache_size)(self.lookup)
+
+  def lemmatize(self, text):
+    """(tokens, lemmas): the tokens of text in order, and {pos: lemma} or None for each of them."""
+    tokens = TOKEN_PATTERN.findall(text)
+    # with the cache, map runs entirely in C for tokens which were seen before
+    return tokens, list(map(self.lookup, tokens))
+
+  def lemmatize_many(self, texts):
+    return [self.lemmatize(text)[1] for text in texts]
+
+
+def lemmatize_documents(table_path, documents, workers=1, cache_size=CACHE_SIZE):
+  """Yields BatchLemmatizer.lemmatize(document) for every document, in order, lemmatized by workers
+  processes. With more than one worker the table is only opened in the workers, which only send back
+  the lemmas (the same dicts many times over, which pickle only sends once per batch), the documents
+  are tokenized again here."""
+  if workers <= 1:
+    lemmatizer = BatchLemmatizer(table_path, cache_size)
+    for document in documents:
+      yield lemmatizer.lemmatize(document)
+    return
+
+  with ProcessPoolExecutor(workers, initializer=start_worker, initargs=(table_path, cache_size)) as pool:
+    # only a couple of batches per worker in flight, so results don't pile up in memory
+    futures = ((batch, pool.submit(lemmatize_batch, batch)) for batch in document_batches(documents, BATCH_SIZE))
+    for batch, future in run_ahead(futures, 2 * workers):
+      for document, lemmas in zip(batch, future.result()):
+        yield TOKEN_PATTERN.findall(document), lemmas
+
+
+def document_batches(documents, batch_size):
+  batch, size = [], 0
+  for document in documents:
+    batch.append(document)
+    size += len(document)
+    if size >= batch_size:
+      yield batch
+      batch, size = [], 0
+  if batch:
+    yield batch
+
+
+# the worker process' lemmatizer, with its own cache
+_lemmatizer = None
+
+
+def start_worker(table_path, cache_size):
+  global _lemmatizer
+  _lemmatizer = BatchLemmatizer(table_path, cache_size)
+
+
+def lemmatize_batch(documents):
+  return _lemmatizer.lemmatize_many(documents)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Lemmatize texts with the lemmatization table.')
+  parser.add_argument('--table', type=str, required=True, help='The lemmatization index (--lemmatization-index) or JSON Lines table (--lemmatization-table)')
+  parser.add_argument('--input', type=str, required=True, help='Text file, every line is lemmatized as a document')
+  parser.add_argument('--output', type=str, required=True, help='Output file, a line for every input line with its tokens and their lemmas, [[token, ...], [{pos: lemma} or null, ...]]')
+  parser.add_argument('--workers', type=int, default=1, help='Number of processes to lemmatize with')
+  parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help='Number of distinct tokens to keep the lemmas of in each process, 0 to not cache')
+  args = parser.parse_args()
+
+  if args.workers < 1:
+    raise Exception("--workers must be at least 1")
+  if args.cache_size < 0:
+    raise Exception("--cache-size can't be negative")
+
+  documents = tokens = 0
+  with open_input(args.input, 'r') as infile, open_output(args.output, 'w') as outfile:
+    lines = (line.rstrip("\n") for line in infile)
+    for result in lemmatize_documents(args.table, lines, args.workers, args.cache_size):
+      outfile.write(json_codec.dumps(result) + "\n")
+      documents += 1
+      tokens += len(result[0])
+  print(f"lemmatized {tokens} tokens in {documents} documents, wrote {args.output}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,157 @@
+"""Times each stage of process_dictionary_data on a synthetic dictionary, and saves the results as
+JSON so runs can be compared.
+
+  python benchmark.py --lemmas 50000 --output results.json
+  python benchmark.py --lemmas 50000 --output new.json --compare results.json
+
+Every stage runs --repeat times on fresh data and the fastest time is kept. With --compare, stages
+which got more than --threshold slower than in the earlier results are listed and the exit status is 1.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import json_codec
+from lemma_sources import read_lemma_sources, source_files
+from output_writer import write_jsonl
+from process_dictionary import (
+  group_entries,
+  insert_all_from_forms_entries,
+  lemma_contributions_by_word,
+  lemma_list,
+  merge_reflexive_entries,
+  parse_entry,
+  rewrite_entries,
+  wiktionary_lemmatizations,
+)
+from synthetic_dictionary import generate
+
+
+class Timer:
+  def __init__(self):
+    self.times = defaultdict(list)
+
+  def time(self, stage, function, *args):
+    gc.collect()
+    start = time.perf_counter()
+    result = function(*args)
+    self.times[stage].append(time.perf_counter() - start)
+    return result
+
+
+def run_stages(timer, data_dir, output_dir):
+  with open(os.path.join(data_dir, "in.jsonl"), "rb") as file:
+    lines = file.readlines()
+  decoded = timer.time("decode json", lambda: [json_codec.loads(line) for line in lines])
+  parsed = timer.time("parse_entry", lambda: [parse_entry(entry) for entry in decoded])
+  # load_entries collects them while parsing
+  parsed_entries = [entry for line_entries in parsed for entry in line_entries]
+  entries = timer.time("group by word", group_entries, parsed_entries)
+
+  reflexive_verbs = timer.time("merge_reflexive_entries", merge_reflexive_entries, entries)
+  forms_index = timer.time("rewrite_entries", rewrite_entries, entries, reflexive_verbs)
+  lemma_index = timer.time("insert_all_from_forms_entries", insert_all_from_forms_entries, entries, forms_index)
+  timer.time("lemma list", lemma_list, lambda: lemma_contributions_by_word(entries.items(), lemma_index))
+
+  files = source_files(os.path.join(data_dir, "cde.txt"), os.path.join(data_dir, "srg", ""))
+  sources = timer.time("read CDE and SRG", read_lemma_sources, files)
+  table = timer.time("lemmatization table", lambda: sources.lemmatization_table(
+    wiktionary_lemmatizations(lemma_contributions_by_word(entries.items(), lemma_index))))
+  # written the way cleanup.py writes them
+  timer.time("write output", write_jsonl, os.path.join(output_dir, "output.jsonl"), list(entries.items()))
+  timer.time("write lemmatization table", write_jsonl, os.path.join(output_dir, "table.jsonl"), list(table.items()))
+  return len(lines), len(entries)
+
+
+def git_revision():
+  try:
+    return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+      cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+  except OSError:
+    return None
+
+
+def compare(results, previous, threshold):
+  regressions = []
+  print(f"{'stage':32} {'before':>9} {'after':>9} {'change':>8}")
+  for stage, seconds in results["stages"].items():
+    before = previous["stages"].get(stage)
+    if before is None:
+      print(f"{stage:32} {'':>9} {seconds:9.3f}")
+      continue
+    change = seconds / before - 1 if before else 0
+    print(f"{stage:32} {before:9.3f} {seconds:9.3f} {change:+8.1%}")
+    if change > threshold:
+      regressions.append(stage)
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Time each stage of processing a synthetic dictionary.')
+  parser.add_argument('--lemmas', type=int, default=20000, help='Number of lemmas in the synthetic dictionary')
+  parser.add_argument('--seed', type=int, default=1, help='Random seed for the synthetic dictionary')
+  parser.add_argument('--data-dir', type=str, required=False, help='Directory with in.jsonl, cde.txt and srg/ to use instead of generating them')
+  parser.add_argument('--repeat', type=int, default=3, help='Number of times to run each stage, the fastest is kept')
+  parser.add_argument('--output', type=str, required=False, help='Where to save the results as JSON')
+  parser.add_argument('--compare', type=str, required=False, help='Earlier results to compare with')
+  parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown over which --compare reports a regression, 0.1 is 10%%')
+  args = parser.parse_args()
+
+  if args.repeat < 1:
+    raise Exception("--repeat must be at least 1")
+
+  with tempfile.TemporaryDirectory(prefix="wiktextract-cleanup-benchmark-") as tmpdir:
+    data_dir = args.data_dir
+    if not data_dir:
+      data_dir = os.path.join(tmpdir, "data")
+      generate(data_dir, args.lemmas, args.seed)
+    timer = Timer()
+    for i in range(args.repeat):
+      lines, words = run_stages(timer, data_dir, tmpdir)
+      print(f"finished run {i + 1} of {args.repeat}")
+
+  results = {
+    "lemmas": None if args.data_dir else args.lemmas,
+    "seed": None if args.data_dir else args.seed,
+    "data_dir": args.data_dir,
+    "input_lines": lines,
+    "words": words,
+    "repeat": args.repeat,
+    "json_codec": json_codec.name,
+    "python": sys.version,
+    "platform": platform.platform(),
+    "git_revision": git_revision(),
+    "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    "stages": {stage: min(times) for stage, times in timer.times.items()},
+    "runs": dict(timer.times),
+  }
+
+  if args.output:
+    with open(args.output, "w") as outfile:
+      json.dump(results, outfile, indent=2)
+    print(f"wrote results to {args.output}")
+
+  if args.compare:
+    with open(args.compare) as file:
+      previous = json.load(file)
+    if previous.get("input_lines") != lines:
+      print(f"note: {args.compare} was run on {previous.get('input_lines')} input lines, this on {lines}")
+    regressions = compare(results, previous, args.threshold)
+    if regressions:
+      print(f"slower by more than {args.threshold:.0%}: {', '.join(regressions)}")
+      exit(1)
+  else:
+    for stage, seconds in results["stages"].items():
+      print(f"{stage:32} {seconds:9.3f}s")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,119 @@
+"""Measures the throughput of batch_lemmatizer.py in tokens per second, on a corpus generated from the
+lemmatization table.
+
+  python benchmark_batch_lemmatizer.py --table table.jsonl [--index table.idx] [--tokens 5000000] [--workers 1,2,4]
+
+The corpus is made of paragraphs of single-token forms from the table, picked with Zipf-like frequencies like words
+in real text, with capitalized sentence starts, punctuation, numbers and a few words which aren't in
+the table. It's lemmatized with the JSONL table and the binary index, with and without the cache, and
+then with the index, the cache and each number of workers. Every run has to give the same results.
+"""
+
+import argparse
+import random
+import time
+
+from batch_lemmatizer import CACHE_SIZE, TOKEN_PATTERN, BatchLemmatizer, lemmatize_documents
+from benchmark_lemmatizer import load_jsonl_table
+from lemmatizer import write_lemmatization_index
+
+ZIPF_EXPONENT = 1.1
+# paragraphs whose results are compared between runs
+SAMPLE = 2000
+
+
+def generate_corpus(forms, tokens, seed=0):
+  """Paragraphs of about 150 tokens, as a list of strings."""
+  rng = random.Random(seed)
+  # forms which are a single token, eg. not multi-word forms
+  forms = sorted(form for form in forms if TOKEN_PATTERN.fullmatch(form))
+  rng.shuffle(forms)
+  cum_weights = []
+  total = 0
+  for rank in range(1, len(forms) + 1):
+    total += rank ** -ZIPF_EXPONENT
+    cum_weights.append(total)
+
+  words = rng.choices(forms, cum_weights=cum_weights, k=tokens)
+  paragraphs = []
+  paragraph, sentence_start = [], True
+  for word in words:
+    roll = rng.random()
+    if roll < 0.01:
+      word = str(rng.randint(1, 2000))
+    elif roll < 0.05:
+      word = word + "zq"
+    if sentence_start:
+      word = word[:1].upper() + word[1:]
+    sentence_start = False
+    roll = rng.random()
+    if roll < 0.06:
+      word += "."
+      sentence_start = True
+    elif roll < 0.12:
+      word += ","
+    paragraph.append(word)
+    if sentence_start and len(paragraph) >= 150:
+      paragraphs.append(" ".join(paragraph))
+      paragraph = []
+  if paragraph:
+    paragraphs.append(" ".join(paragraph))
+  return paragraphs
+
+
+def run(table_path, corpus, workers, cache_size):
+  """Seconds to open the table (in this process, with one worker) and to lemmatize the corpus, the
+  number of tokens and of tokens not in the table, and the results for the first paragraphs. Results
+  aren't all kept, since holding millions of them would slow everything down."""
+  start = time.perf_counter()
+  if workers == 1:
+    lemmatizer = BatchLemmatizer(table_path, cache_size)
+    results = map(lemmatizer.lemmatize, corpus)
+  else:
+    results = lemmatize_documents(table_path, corpus, workers, cache_size)
+  opened = time.perf_counter()
+  tokens = unknown = 0
+  sample = []
+  for tokens_lemmas in results:
+    if len(sample) < SAMPLE:
+      sample.append(tokens_lemmas)
+    tokens += len(tokens_lemmas[0])
+    unknown += tokens_lemmas[1].count(None)
+  return opened - start, time.perf_counter() - opened, (tokens, unknown, sample)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark the batch lemmatizer in tokens per second.')
+  parser.add_argument('--table', type=str, required=True, help='The path of the JSONL lemmatization table')
+  parser.add_argument('--index', type=str, required=False, help='The path of the binary index, written from the table if not given')
+  parser.add_argument('--tokens', type=int, default=5000000, help='Number of words in the generated corpus')
+  parser.add_argument('--workers', type=str, default="1,2,4", help='Comma separated numbers of workers to run with the index and the cache')
+  args = parser.parse_args()
+
+  table = load_jsonl_table(args.table)
+  index_path = args.index
+  if not index_path:
+    index_path = args.table + ".idx"
+    write_lemmatization_index(index_path, table)
+    print(f"wrote lemmatization index to {index_path}")
+
+  corpus = generate_corpus(table, args.tokens)
+  del table
+  print(f"generated {len(corpus)} paragraphs, {sum(len(paragraph) for paragraph in corpus) / 1024 / 1024:.1f} MiB")
+
+  runs = [(label, path, 1, cache_size) for label, path in (("jsonl", args.table), ("index", index_path))
+    for cache_size in (0, CACHE_SIZE)]
+  runs += [("index", index_path, int(workers), CACHE_SIZE) for workers in args.workers.split(",") if int(workers) > 1]
+  expected = None
+  for label, path, workers, cache_size in runs:
+    open_seconds, seconds, results = run(path, corpus, workers, cache_size)
+    tokens, unknown, _ = results
+    print(f"{label:6} cache {cache_size:6} workers {workers}: opened in {open_seconds:5.2f} s, {tokens} tokens ({unknown} not in the table) in {seconds:6.2f} s, {tokens / seconds / 1e6:5.2f} M tokens/s")
+    if expected is None:
+      expected = results
+    elif results != expected:
+      raise Exception(f"{label} with cache {cache_size} and {workers} workers gave different results")
+
+
+if __name__ == "__main__":
+  main()
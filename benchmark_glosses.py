@@ -0,0 +1,144 @@
+"""Microbenchmark and check for gloss parsing, against the implementations from before the patterns were
+precompiled and glosses without parentheses skipped the regex.
+
+Every gloss of the input goes through both versions of rip_defin_label_gloss, and every gloss a failed
+form_of could be extracted from through both versions of extract_form_of. The results have to be the
+same, then both are timed.
+
+  python benchmark_glosses.py --input input.jsonl
+  python benchmark_glosses.py --lemmas 20000
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+import json_codec
+from process_dictionary import (
+  FAILED_FORM_OF_PROBLEMATIC_CONJUGATIONS,
+  extract_form_of,
+  remove_ending_colon,
+  rip_defin_label_gloss,
+  tags_for_defin,
+)
+from synthetic_dictionary import generate
+
+
+def reference_rip_defin_label_gloss(orig_gloss, extra_labels):
+  if orig_gloss == None:
+    return {"definition": None}
+
+  pattern = r'(?:\(([^)]*)\))?(.*?)\s*(?:\(([^)]*)\))?$'
+
+  match = re.match(pattern, orig_gloss)
+  if not match:
+    raise Exception("invalid gloss, failed regex")
+
+  label, definition, gloss = match.groups()
+
+  extra_tag_label = ", ".join([tag for tag in extra_labels if tag not in orig_gloss])
+  if extra_tag_label:
+    if label:
+      label += ", " + extra_tag_label
+    else:
+      label = extra_tag_label
+
+  return {k: v for k, v in [("label", label), ("definition", definition.strip() if definition else None), ("gloss", gloss)] if v is not None}
+
+
+def reference_extract_form_of(gloss):
+  first_pass_lemma = gloss.split(" of ")[-1]
+  if len(first_pass_lemma.split(" ")) == 1:
+    return first_pass_lemma
+  else:
+    for conj in FAILED_FORM_OF_PROBLEMATIC_CONJUGATIONS:
+      if conj in first_pass_lemma:
+        pattern = r"\b" + re.escape(conj) + r"\b\s+(\w+)"
+        match = re.search(pattern, first_pass_lemma)
+        if match:
+            return match.group(1)
+    return first_pass_lemma.split(",")[0]
+
+
+def collect_glosses(input_file):
+  """(gloss, extra labels) as clean_glosses passes them, and every single gloss string."""
+  defin_glosses, glosses = [], []
+  with open(input_file, 'rb') as file:
+    for line in file:
+      for sense in json_codec.loads(line).get('senses', []):
+        if len(sense.get('raw_glosses', [])) == 1:
+          orig_gloss = sense['raw_glosses'][0]
+        elif sense.get("glosses"):
+          orig_gloss = ", ".join([remove_ending_colon(gloss) for gloss in sense['glosses']])
+        else:
+          orig_gloss = None
+        defin_glosses.append((orig_gloss, tags_for_defin(sense)))
+        glosses.extend(gloss for gloss in sense.get('glosses') or [] if gloss)
+  return defin_glosses, glosses
+
+
+def results_or_error(function, args):
+  results = []
+  for arg in args:
+    try:
+      results.append(function(*arg))
+    except Exception as e:
+      results.append(repr(e))
+  return results
+
+
+def best_time(function, args, repeat):
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    for arg in args:
+      try:
+        function(*arg)
+      except Exception:
+        pass
+    times.append(time.perf_counter() - start)
+  return min(times)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark and check gloss parsing against the original implementation.')
+  parser.add_argument('--input', type=str, required=False, help='The path of the input file, a synthetic dictionary is generated without it')
+  parser.add_argument('--lemmas', type=int, default=20000, help='Number of lemmas in the synthetic dictionary')
+  parser.add_argument('--repeat', type=int, default=5, help='Number of timing runs, the fastest is kept')
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory(prefix="wiktextract-cleanup-benchmark-") as tmpdir:
+    input_file = args.input
+    if not input_file:
+      generate(tmpdir, args.lemmas)
+      input_file = os.path.join(tmpdir, "in.jsonl")
+    defin_glosses, glosses = collect_glosses(input_file)
+  single_glosses = [(gloss,) for gloss in glosses]
+  with_parentheses = sum(1 for gloss, _ in defin_glosses if gloss and "(" in gloss)
+  print(f"{len(defin_glosses)} definitions, {with_parentheses} with parentheses, {len(glosses)} glosses")
+
+  failed = False
+  for name, reference, current, inputs in (
+      ("rip_defin_label_gloss", reference_rip_defin_label_gloss, rip_defin_label_gloss, defin_glosses),
+      ("extract_form_of", reference_extract_form_of, extract_form_of, single_glosses)):
+    expected, results = results_or_error(reference, inputs), results_or_error(current, inputs)
+    mismatches = [(arg, want, got) for arg, want, got in zip(inputs, expected, results) if want != got]
+    for arg, want, got in mismatches[:10]:
+      print(f"  {name}{arg}: expected {want!r}, got {got!r}")
+    if mismatches:
+      print(f"{name}: {len(mismatches)} results differ")
+      failed = True
+      continue
+
+    before, after = best_time(reference, inputs, args.repeat), best_time(current, inputs, args.repeat)
+    print(f"{name:22} {before * 1e6 / len(inputs):6.2f} us -> {after * 1e6 / len(inputs):6.2f} us per call, {before / after:4.1f}x")
+
+  if failed:
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,98 @@
+"""Compares the binary lemmatization index with loading the JSONL table into a dict.
+
+Cold start (time and peak memory to be ready for lookups) is measured in a fresh process for each, and
+lookup latency on a random sample of forms from the table plus as many forms which aren't in it.
+
+  python benchmark_lemmatizer.py --table table.jsonl [--index table.idx] [--lookups 100000]
+
+Without --index the index is written next to the table first.
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+
+from lemmatizer import Lemmatizer, load_jsonl_table, write_lemmatization_index
+from stats import peak_rss_bytes
+
+
+def peak_rss_kib():
+  return peak_rss_bytes() // 1024
+
+
+def cold_start(kind, path):
+  # run in a fresh process by main, prints the time to load and the peak RSS
+  start = time.perf_counter()
+  if kind == "jsonl":
+    table = load_jsonl_table(path)
+  else:
+    table = Lemmatizer(path)
+  seconds = time.perf_counter() - start
+  print(json.dumps({"seconds": seconds, "max_rss_kib": peak_rss_kib()}))
+
+
+def measure_cold_start(kind, path):
+  baseline = subprocess.run([sys.executable, __file__, "--cold-start", kind, "--table", path, "--baseline"],
+    check=True, capture_output=True, text=True)
+  result = subprocess.run([sys.executable, __file__, "--cold-start", kind, "--table", path],
+    check=True, capture_output=True, text=True)
+  baseline, result = json.loads(baseline.stdout), json.loads(result.stdout)
+  return result["seconds"], (result["max_rss_kib"] - baseline["max_rss_kib"]) / 1024
+
+
+def time_per_call(function, forms):
+  start = time.perf_counter()
+  for form in forms:
+    function(form)
+  return (time.perf_counter() - start) / len(forms)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark the binary lemmatization index against the JSONL table.')
+  parser.add_argument('--table', type=str, required=True, help='The path of the JSONL lemmatization table')
+  parser.add_argument('--index', type=str, required=False, help='The path of the binary index, written from the table if not given')
+  parser.add_argument('--lookups', type=int, default=100000, help='Number of forms to look up')
+  parser.add_argument('--cold-start', choices=["jsonl", "index"], help=argparse.SUPPRESS)
+  parser.add_argument('--baseline', action='store_true', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.cold_start:
+    if args.baseline:
+      print(json.dumps({"seconds": 0, "max_rss_kib": peak_rss_kib()}))
+    else:
+      cold_start(args.cold_start, args.table)
+    return
+
+  table = load_jsonl_table(args.table)
+  index_path = args.index
+  if not index_path:
+    index_path = args.table + ".idx"
+    write_lemmatization_index(index_path, table)
+    print(f"wrote lemmatization index to {index_path}")
+
+  for kind, path in (("jsonl", args.table), ("index", index_path)):
+    seconds, megabytes = measure_cold_start(kind, path)
+    print(f"{kind:6} cold start {seconds * 1000:9.1f} ms, {megabytes:7.1f} MiB")
+
+  rng = random.Random(0)
+  forms = list(table)
+  hits = [rng.choice(forms) for _ in range(args.lookups)]
+  misses = [form + "zq" for form in hits]
+  lemmatizer = Lemmatizer(index_path)
+  for label, sample in (("hits", hits), ("misses", misses)):
+    for kind, function in (("jsonl", table.get), ("index", lemmatizer.lookup)):
+      print(f"{kind:6} lookup {label:6} {time_per_call(function, sample) * 1e6:7.2f} us")
+  start = time.perf_counter()
+  lemmatizer.lookup_many(hits)
+  print(f"index  lookup_many    {(time.perf_counter() - start) / len(hits) * 1e6:7.2f} us per form")
+  for form in hits[:1000]:
+    if lemmatizer.lookup(form) != table[form]:
+      raise Exception(f"index and table differ for {form}")
+  lemmatizer.close()
+
+
+if __name__ == "__main__":
+  main()
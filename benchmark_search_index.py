@@ -0,0 +1,62 @@
+"""Measures query latency of the search index, against a linear scan over the words of the main output.
+
+Queries are random words from the output: prefixes of them for prefix lookups, and the words
+folded and with one character deleted for fuzzy lookups.
+
+  python benchmark_search_index.py --index search.idx --output output.jsonl [--queries 2000]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from compressed_io import open_input
+from search_index import SearchIndex, fold
+
+
+def linear_prefix(words, query, limit=10):
+  # what looking words up without the index does, so without frequencies to rank by
+  key = fold(query)
+  return [word for word in words if fold(word).startswith(key)][:limit]
+
+
+def time_per_call(function, queries):
+  start = time.perf_counter()
+  for query in queries:
+    function(query)
+  return (time.perf_counter() - start) / len(queries)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark search index queries against a linear scan of the output.')
+  parser.add_argument('--index', type=str, required=True, help='The path of the search index')
+  parser.add_argument('--output', type=str, required=True, help='The main output the index was built with, in the default [word, entries] format')
+  parser.add_argument('--queries', type=int, default=2000, help='Number of queries of each kind')
+  args = parser.parse_args()
+
+  with open_input(args.output, 'r') as file:
+    words = [json.loads(line)[0] for line in file]
+  index = SearchIndex(args.index)
+  print(f"{len(index)} words and forms in the index, {len(words)} words in the output")
+
+  rng = random.Random(0)
+  samples = [rng.choice(words) for _ in range(args.queries)]
+  prefixes = [string[:rng.randint(1, min(4, len(string)))] for string in samples]
+  typos = []
+  for string in samples:
+    key = fold(string)
+    i = rng.randrange(len(key))
+    typos.append(key[:i] + key[i + 1:] if len(key) > 2 else key)
+
+  # the scan is slow, so it only gets a sample of the queries
+  scan = time_per_call(lambda query: linear_prefix(words, query), prefixes[:20])
+  print(f"linear scan prefix {scan * 1000:8.3f} ms")
+  for label, function, queries in (("prefix", index.prefix, prefixes), ("fuzzy", index.fuzzy, typos),
+      ("search", index.search, typos)):
+    print(f"index {label:12} {time_per_call(function, queries) * 1000:8.3f} ms")
+  index.close()
+
+
+if __name__ == "__main__":
+  main()
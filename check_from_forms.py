@@ -0,0 +1,115 @@
+"""Regression check for the from_forms insertion pass.
+
+Runs the indexed insert_from_forms_entries and the original linear-scan version on copies of the same
+post-processed entries and checks they insert exactly the same entries in the same order.
+
+  python check_from_forms.py --input input.jsonl
+"""
+
+import argparse
+import copy
+import sys
+
+from process_dictionary import (
+  insert_all_from_forms_entries,
+  load_entries,
+  merge_reflexive_entries,
+  rewrite_entries,
+  wiktionary_pos_conversion,
+)
+
+
+def reference_find_lemmas(defin, entries, forms_set=None, pos=None, first_call=True):
+  # the original recursive find_lemmas_from_form_of_defin, kept as it was so the indexed version is
+  # checked against it rather than against itself
+  pos = pos if pos else defin['pos']
+  forms_set = forms_set if forms_set else set()
+  form = defin.get("form_of")
+
+  if form in forms_set:
+    return {form}
+  elif defin['pos'] != pos:
+    return {}
+  elif not form:
+    return {defin['word']}
+  elif form not in entries:
+    return {None}
+  else:
+
+    forms_set.add(form)
+
+    child_lemmas = {lemma
+      for form_defin in entries.get(form)
+        for lemma in reference_find_lemmas(form_defin, entries, forms_set, pos, False)}
+
+    if first_call:
+      child_lemmas = {lemma for lemma in child_lemmas if lemma != defin['word']}
+      return child_lemmas if child_lemmas else {None}
+    else:
+      return child_lemmas if child_lemmas else {None}
+
+
+def reference_insert_from_forms_entries(defin, entries):
+  # insert_from_forms_entries before the forms and form_of indexes, scanning forms lists and walking
+  # the form_of graph from scratch every time
+  if defin.get("forms"):
+    for form in defin.get("forms"):
+      if form == defin['word']:
+        pass
+      elif defin.get("form_of") and any(
+          any(
+            lemma_defin.get("pos") == defin.get("pos") and
+            form in lemma_defin.get("forms", [])
+            for lemma_defin in entries.get(lemma, [])
+          )
+          for lemma in reference_find_lemmas(defin, entries)
+        ):
+        pass
+      else:
+        if not any(
+            form_defin.get("pos") == defin.get("pos") and
+            (defin['word'] in reference_find_lemmas(form_defin, entries) or
+            defin['word'] == form_defin.get('form_of') or
+            defin['word'] in form_defin.get("forms", [])
+            )
+          for form_defin in entries.get(form, [])):
+          new_form_of = {"word": form, "pos": defin['pos'], "f_pos": wiktionary_pos_conversion[defin.get("pos")], "from_forms": True, "form_of": defin['word'], "definitions": []}
+          entries[form].append(new_form_of)
+
+
+def inserted_entries(all_entries_matching_word):
+  return [(word, defin['pos'], defin['form_of'])
+    for word, entries in all_entries_matching_word.items()
+      for defin in entries if defin.get("from_forms")]
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Check the from_forms insertion pass against the original implementation.')
+  parser.add_argument('--input', type=str, required=True, help='The path of the input file')
+  parser.add_argument('--workers', type=int, default=1, help='Number of processes to parse the input file with')
+  args = parser.parse_args()
+
+  all_entries_matching_word = load_entries(args.input, args.workers)
+  reflexive_verbs = merge_reflexive_entries(all_entries_matching_word)
+  rewrite_entries(all_entries_matching_word, reflexive_verbs)
+  reference_entries = copy.deepcopy(all_entries_matching_word)
+
+  insert_all_from_forms_entries(all_entries_matching_word)
+  for (word, entries) in list(reference_entries.items()):
+    for defin in entries:
+      reference_insert_from_forms_entries(defin, reference_entries)
+
+  inserted, expected = inserted_entries(all_entries_matching_word), inserted_entries(reference_entries)
+  if inserted != expected or list(all_entries_matching_word) != list(reference_entries):
+    missing, extra = set(expected) - set(inserted), set(inserted) - set(expected)
+    print(f"from_forms entries differ: {len(missing)} missing, {len(extra)} extra")
+    for entry in sorted(missing)[:20]:
+      print(f"  missing {entry}")
+    for entry in sorted(extra)[:20]:
+      print(f"  extra {entry}")
+    sys.exit(1)
+  print(f"from_forms entries match: {len(inserted)} inserted")
+
+
+if __name__ == "__main__":
+  main()
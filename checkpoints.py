@@ -0,0 +1,135 @@
+"""Checkpoints of all_entries_matching_word between the post-processing passes, so a run can start
+from the pass being worked on instead of parsing the whole input again.
+
+With --checkpoint-dir the entries are pickled after loading and after each pass, one file per stage,
+replacing the previous run's. --resume-from <pass> loads the latest valid checkpoint from before that
+pass and runs the passes after it. A checkpoint is only valid for the same input file (by a hash of
+its content) and the same code for its stage and every stage before it: the code of a pass is the
+source of its functions, the code of loading is the rest of process_dictionary.py and entries.py,
+without the functions which only run after the last pass. So editing eg. process_reflexive_defin
+keeps the checkpoint after loading and drops the ones after the reflexive merge.
+
+Entries are pickled together with whatever the next pass needs from the previous one (the merged
+reflexive verbs), in one dump, so entries which share a forms list still share it when loaded.
+"""
+
+import gc
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+from contextlib import contextmanager
+
+import entries
+import indexes
+import process_dictionary as pd
+
+STAGES = ["load"] + pd.POST_PROCESSING_PASSES
+# what --resume-from accepts, "outputs" resumes after the last pass
+RESUME_POINTS = {name.replace(" ", "-").replace("_", "-"): name for name in pd.POST_PROCESSING_PASSES}
+RESUME_POINTS["outputs"] = None
+
+PASS_CODE = {
+  "reflexive merge": [pd.merge_reflexive_entries, pd.is_defin_reflexive, pd.process_reflexive_defin],
+  "entry rewrite": [pd.rewrite_entries, pd.extract_multi_token_forms],
+  "from_forms insertion": [pd.insert_all_from_forms_entries, pd.insert_from_forms_entries, indexes],
+}
+# only used after the last pass, changing them doesn't invalidate any checkpoint
+LATER_CODE = [pd.process_dictionary_data, pd.post_process, pd.lemma_list, pd.lemmatization_table_from,
+  pd.wiktionary_lemmatizations, pd.vocabulary_frequencies, pd.lemma_contributions_by_word, pd.find_lemmas_from_form_of_defin]
+
+
+def load_code():
+  source = inspect.getsource(pd)
+  for function in LATER_CODE + [code for codes in PASS_CODE.values() for code in codes if code is not indexes]:
+    source = source.replace(inspect.getsource(function), "")
+  return [source, inspect.getsource(entries)]
+
+
+def stage_versions():
+  """{stage: hash of the code of that stage and every stage before it}"""
+  digest = hashlib.blake2b(sys.version.encode(), digest_size=16)
+  versions = {}
+  for stage in STAGES:
+    for source in load_code() if stage == "load" else [inspect.getsource(code) for code in PASS_CODE[stage]]:
+      digest.update(source.encode())
+    versions[stage] = digest.copy().hexdigest()
+  return versions
+
+
+def file_digest(path):
+  digest = hashlib.blake2b(digest_size=16)
+  with open(path, 'rb') as file:
+    while block := file.read(1024 * 1024):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+@contextmanager
+def collections_disabled():
+  enabled = gc.isenabled()
+  gc.disable()
+  try:
+    yield
+  finally:
+    if enabled:
+      gc.enable()
+
+
+class Checkpoints:
+  def __init__(self, directory, input_file):
+    self.directory = directory
+    self.input_file = input_file
+    self._input_digest = None
+    self.versions = stage_versions()
+
+  def input_digest(self):
+    if self._input_digest is None:
+      self._input_digest = file_digest(self.input_file)
+    return self._input_digest
+
+  def path(self, stage):
+    return os.path.join(self.directory, f"{STAGES.index(stage):02}-{stage.replace(' ', '-').replace('_', '-')}.checkpoint")
+
+  def header(self, stage):
+    return {"stage": stage, "input": self.input_digest(), "code": self.versions[stage]}
+
+  def save(self, stage, all_entries_matching_word, extra=None):
+    os.makedirs(self.directory, exist_ok=True)
+    path = self.path(stage)
+    with open(path + ".tmp", 'wb') as file:
+      pickle.dump(self.header(stage), file, protocol=pickle.HIGHEST_PROTOCOL)
+      # there are millions of entries and no cycles among them, so collections only slow pickling down
+      with collections_disabled():
+        pickle.dump((all_entries_matching_word, extra), file, protocol=pickle.HIGHEST_PROTOCOL)
+    # a run stopped halfway through writing leaves the old checkpoint
+    os.replace(path + ".tmp", path)
+
+  def load(self, stage):
+    """(all_entries_matching_word, extra) from the checkpoint after stage, None if there's none or it's
+    for another input or older code."""
+    try:
+      with open(self.path(stage), 'rb') as file:
+        header = pickle.load(file)
+        if header != self.header(stage):
+          reason = "the input" if header.get("input") != self.input_digest() else "the code"
+          print(f"checkpoint after {stage} is out of date, {reason} changed since it was written")
+          return None
+        with collections_disabled():
+          return pickle.load(file)
+    except FileNotFoundError:
+      return None
+
+  def resume(self, resume_from):
+    """Loads the latest valid checkpoint from before the pass resume_from (a key of RESUME_POINTS).
+    Returns (passes done, all_entries_matching_word, extra), None if there's no valid checkpoint."""
+    before = RESUME_POINTS[resume_from]
+    stages = STAGES[:STAGES.index(before)] if before else STAGES
+    for stage in reversed(stages):
+      loaded = self.load(stage)
+      if loaded is not None:
+        print(f"resuming from the checkpoint after {stage}")
+        return STAGES.index(stage), *loaded
+    print("no valid checkpoint to resume from, starting from the input file")
+    return None
@@ -1,6 +1,16 @@
 import argparse
-import json
+import os
+import sqlite3
+import json_codec
+from checkpoints import RESUME_POINTS
+from compressed_io import open_output
+from dictionary_patch import patch_path, write_patch
+from dictionary_store import write_dictionary_store
+from lemmatizer import write_lemmatization_index
+from output_writer import write_jsonl
 from process_dictionary import process_dictionary_data
+from search_index import write_search_index
+from stats import NO_STATS, PROFILERS, Stats
 
 
 def main():
@@ -8,37 +18,132 @@ def main():
 
   parser.add_argument('--input', type=str, required=True, help='The path of the input file')
   parser.add_argument('--output', type=str, required=True, help='The path of the output file')
+  parser.add_argument('--output-format', choices=["jsonl", "sqlite"], default="jsonl", help='Write the main output as JSON Lines, or as an indexed SQLite database to look words up in (see dictionary_store.py)')
   parser.add_argument('--no-post-process', type=bool, required=False, help='Just parse entries')
   parser.add_argument('--lemmatization-table', type=str, required=False, help='Create lemmatization table, output file')
+  parser.add_argument('--lemmatization-index', type=str, required=False, help='Create lemmatization table as a binary index which can be memory-mapped, output file (see lemmatizer.py)')
+  parser.add_argument('--search-index', type=str, required=False, help='Create a prefix and fuzzy search index over every word and form, ranked by CDE frequency, output file (see search_index.py)')
   parser.add_argument('--cde-input', type=str, required=False, help='Corpus del Español forms list')
   parser.add_argument('--srg-input-dir', type=str, required=False, help='Spanish Resource Grammar inflections list dir')
   parser.add_argument('--lemma-list', type=str, required=False, help='Generate list of lemmas, output file')
   parser.add_argument('--one-entry-per-line', action='store_true', help='Output each entry on a separate line instead of grouping by word')
+  parser.add_argument('--lemma-sources-cache', type=str, required=False, help='File to keep a compact snapshot of the CDE and SRG data in between runs, defaults to lemma_sources.snapshot in the --incremental-cache directory')
   parser.add_argument('--no-wiktionary', action='store_true', help='Exclude wiktionary data from lemmatization table (only use CDE and SRG data)')
+  parser.add_argument('--json-codec', choices=json_codec.CODECS, default='auto', help='JSON library to decode the input with, auto uses orjson or msgspec if installed')
+  parser.add_argument('--workers', type=int, default=1, help='Number of processes to parse the input file and encode the outputs with')
+  parser.add_argument('--streaming', action='store_true', help='Spill parsed entries to disk and post-process them one bucket at a time to bound memory use')
+  parser.add_argument('--streaming-buckets', type=int, default=64, help='Number of on-disk buckets for --streaming, each holds about 1/N of the entries while they are post-processed')
+  parser.add_argument('--streaming-dir', type=str, required=False, help='Directory for --streaming temporary files, defaults to the system temp directory')
+  parser.add_argument('--incremental-cache', type=str, required=False, help='Directory to cache parsed lines in between runs, so only lines which changed are parsed again')
+  parser.add_argument('--shards', type=int, required=False, help='Split the main output and the lemmatization table into this many files by a hash of the word, with a manifest')
+  parser.add_argument('--sequential', action='store_true', help="Run the processing stages one after another, instead of reading CDE and SRG and writing the output while the dictionary is processed")
+  parser.add_argument('--previous-output', type=str, required=False, help='Main output of an earlier build, to also write a patch from it to the new output next to the output (see dictionary_patch.py)')
+  parser.add_argument('--previous-lemmatization-table', type=str, required=False, help='Lemmatization table of an earlier build, to also write a patch from it to the new table next to the table')
+  parser.add_argument('--checkpoint-dir', type=str, required=False, help='Directory to save the parsed entries to after loading and after each post-processing pass, for --resume-from (see checkpoints.py)')
+  parser.add_argument('--resume-from', choices=list(RESUME_POINTS), required=False, help='Skip parsing and the passes before this one by loading the latest valid checkpoint from --checkpoint-dir, outputs skips all passes')
+  parser.add_argument('--stats', type=str, required=False, help='Write wall time, memory use and counters for each stage to this file as JSON')
+  parser.add_argument('--profile', choices=PROFILERS, required=False, help='Also profile each stage with cProfile or tracemalloc, dumps are written next to the --stats file')
 
   args = parser.parse_args()
 
-  if args.no_wiktionary and not args.lemmatization_table:
-    raise Exception("--no-wiktionary can only be used when --lemmatization-table is specified")
+  if args.output_format == "sqlite" and args.one_entry_per_line:
+    raise Exception("--one-entry-per-line can't be used with --output-format=sqlite")
+  if args.shards is not None:
+    if args.shards < 1:
+      raise Exception("--shards must be at least 1")
+    if args.output_format == "sqlite":
+      raise Exception("--shards can't be used with --output-format=sqlite")
 
-  if args.lemmatization_table:
+  if args.previous_output:
+    if args.output_format == "sqlite" or args.one_entry_per_line or args.shards:
+      raise Exception("--previous-output only works with the default output format, without --shards")
+    if os.path.abspath(args.previous_output) == os.path.abspath(args.output):
+      raise Exception("--previous-output can't be the same file as --output")
+  if args.previous_lemmatization_table:
+    if not args.lemmatization_table or args.shards:
+      raise Exception("--previous-lemmatization-table requires --lemmatization-table, without --shards")
+    if os.path.abspath(args.previous_lemmatization_table) == os.path.abspath(args.lemmatization_table):
+      raise Exception("--previous-lemmatization-table can't be the same file as --lemmatization-table")
+
+  if args.checkpoint_dir and args.streaming:
+    raise Exception("--checkpoint-dir can't be used with --streaming, which post-processes one bucket at a time")
+  if args.resume_from:
+    if not args.checkpoint_dir:
+      raise Exception("--resume-from requires --checkpoint-dir")
+    if args.no_post_process:
+      raise Exception("--resume-from can't be used with --no-post-process")
+
+  if args.no_wiktionary and not (args.lemmatization_table or args.lemmatization_index):
+    raise Exception("--no-wiktionary can only be used when --lemmatization-table or --lemmatization-index is specified")
+
+  if args.lemmatization_table or args.lemmatization_index:
     if args.no_post_process:
       raise Exception("generating lemmatization table can't be done with no-post-process.")
     if not args.cde_input:
       raise Exception("cde-input required if generating lemmatization table")
     if not args.srg_input_dir:
       raise Exception("srg-input-dir required if generating lemmatization table")
+  if args.search_index:
+    if args.no_post_process:
+      raise Exception("generating search index can't be done with no-post-process.")
+    if not args.cde_input or not args.srg_input_dir:
+      raise Exception("cde-input and srg-input-dir required if generating search index")
+  json_codec.use(args.json_codec)
+
+  if args.workers < 1:
+    raise Exception("--workers must be at least 1")
+  if args.streaming_buckets < 1:
+    raise Exception("--streaming-buckets must be at least 1")
+  if args.profile and not args.stats:
+    raise Exception("--profile requires --stats")
+  stats = Stats(profile=args.profile, profile_prefix=args.stats) if args.stats else NO_STATS
   if args.no_post_process and args.lemma_list:
     print("lemma list won't be generated if no-post-process is true")
   
+  def write_output(all_entries_matching_word):
+    try:
+      # items() rather than indexing, since with --streaming entries can only be iterated in order
+      if args.output_format == "sqlite":
+        write_dictionary_store(args.output, all_entries_matching_word.items())
+      else:
+        if args.one_entry_per_line:
+          pairs = ((entry, entry_dict) for entry, entry_dicts in all_entries_matching_word.items() for entry_dict in entry_dicts)
+        else:
+          pairs = all_entries_matching_word.items()
+        # only lists can be encoded by several workers, the --streaming entries are iterated once
+        if args.workers > 1 and not args.streaming:
+          pairs = list(pairs)
+        write_jsonl(args.output, pairs, with_key=not args.one_entry_per_line, workers=args.workers, shards=args.shards)
+      print(f"wrote main dictionary to {args.output}")
+    except (IOError, sqlite3.Error) as e:
+      print(f"An error occurred while writing to the file {args.output}: {e}")
+      exit(1)
+
+  # the output is written while the lemma list and table are built, unless it's encoded by several
+  # workers: those are forked, so they get the entries without pickling them, and forking while the
+  # scheduler's threads are running isn't safe. The parsing workers, which do run alongside them, are
+  # started from a fork server instead (see process_dictionary.parse_pool)
+  write_while_processing = args.workers == 1 and not args.sequential
   result = process_dictionary_data(
     input_file=args.input,
     no_post_process=args.no_post_process,
-    lemmatization_table=bool(args.lemmatization_table),
+    lemmatization_table=bool(args.lemmatization_table or args.lemmatization_index),
     cde_input=args.cde_input,
     srg_input_dir=args.srg_input_dir,
     generate_lemma_list=bool(args.lemma_list),
-    no_wiktionary=args.no_wiktionary
+    no_wiktionary=args.no_wiktionary,
+    streaming=args.streaming,
+    streaming_buckets=args.streaming_buckets,
+    streaming_dir=args.streaming_dir,
+    workers=args.workers,
+    incremental_cache=args.incremental_cache,
+    lemma_sources_cache=args.lemma_sources_cache,
+    stats=stats,
+    write_entries=write_output if write_while_processing else None,
+    concurrent=not args.sequential,
+    checkpoint_dir=args.checkpoint_dir,
+    resume_from=args.resume_from,
+    search_vocabulary=bool(args.search_index)
   )
 
   if result is None:
@@ -47,38 +152,52 @@ def main():
   all_entries_matching_word = result.get('entries', {})
   pos_lookup_table = result.get('pos_lookup_table', {})
   lemma_set = result.get('lemma_set', set())
+  search_vocabulary = result.get('search_vocabulary', {})
 
-  try:
-    with open(args.output, 'w') as outfile:
-      if args.one_entry_per_line:
-        for entry in all_entries_matching_word:
-          for entry_dict in all_entries_matching_word[entry]:
-            outfile.write(json.dumps(entry_dict) + "\n")
-      else:
-        for entry in all_entries_matching_word:
-          outfile.write(json.dumps([entry, all_entries_matching_word[entry]]) + "\n")
-    print(f"wrote main dictionary to {args.output}")
-    
-  except IOError as e:
-    print(f"An error occurred while writing to the file {args.output}: {e}")
-    exit(1)
+  if not write_while_processing:
+    with stats.stage("write output"):
+      write_output(all_entries_matching_word)
   
   try:
     if args.lemmatization_table:
-      with open(args.lemmatization_table, "w") as outfile:
-        for entry in pos_lookup_table:
-          outfile.write(json.dumps([entry, pos_lookup_table[entry]]) + "\n")
+      with stats.stage("write lemmatization table"):
+        write_jsonl(args.lemmatization_table, list(pos_lookup_table.items()), workers=args.workers, shards=args.shards)
       print(f"wrote lemmatization table to {args.lemmatization_table}")
+
+    if args.lemmatization_index:
+      with stats.stage("write lemmatization index"):
+        write_lemmatization_index(args.lemmatization_index, pos_lookup_table)
+      print(f"wrote lemmatization index to {args.lemmatization_index}")
+
+    if args.search_index:
+      with stats.stage("write search index"):
+        write_search_index(args.search_index, search_vocabulary)
+      print(f"wrote search index to {args.search_index}")
     
     if args.lemma_list:
-      with open(args.lemma_list, "w") as outfile:
-        for lemma in lemma_set:
-          outfile.write(lemma + "\n")
+      with stats.stage("write lemma list"):
+        with open_output(args.lemma_list, "w") as outfile:
+          for lemma in lemma_set:
+            outfile.write(lemma + "\n")
       print(f"wrote lemma list to {args.lemma_list}")
       
   except IOError as e:
     print(f"An error occurred while writing to the file {args.lemmatization_table}: {e}")
     exit(1)
 
+  for previous, path, name in ((args.previous_output, args.output, "output"), (args.previous_lemmatization_table, args.lemmatization_table, "lemmatization table")):
+    if previous:
+      try:
+        with stats.stage(f"write {name} patch"):
+          counts = write_patch(previous, path, patch_path(path))
+        print(f"wrote {name} patch to {patch_path(path)}: " + ", ".join(f"{n} {change}" for change, n in counts.items()))
+      except IOError as e:
+        print(f"An error occurred while writing the patch from {previous} to {path}: {e}")
+        exit(1)
+
+  if args.stats:
+    stats.write(args.stats)
+    print(f"wrote stats to {args.stats}")
+
 if __name__ == "__main__":
   main()
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""Opening input and output files transparently by extension: .gz, .bz2, .xz and .zst (which needs
+the optional zstandard package). Compressed input is decompressed in a background thread so
+decompression overlaps with parsing, since all of these decompressors release the GIL."""
+
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+
+def _open_zstd(path, mode):
+  if zstandard is None:
+    raise Exception(f"reading or writing {path} requires the zstandard package")
+  if mode == 'rb':
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+  return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+
+
+COMPRESSED_OPENERS = {
+  ".gz": gzip.open,
+  ".bz2": bz2.open,
+  ".xz": lzma.open,
+  ".zst": _open_zstd,
+}
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def compression_opener(path):
+  for extension, opener in COMPRESSED_OPENERS.items():
+    if str(path).endswith(extension):
+      return opener
+  return None
+
+
+def open_input(path, mode='r', encoding=None):
+  """Like open(path, mode) for reading, 'r' or 'rb', decompressing by extension."""
+  opener = compression_opener(path)
+  if opener is None:
+    return open(path, mode, encoding=encoding)
+  binary = io.BufferedReader(BackgroundReader(opener(path, 'rb')), READ_CHUNK_SIZE)
+  if mode == 'rb':
+    return binary
+  return io.TextIOWrapper(binary, encoding=encoding or 'utf-8')
+
+
+def open_output(path, mode='w', encoding=None):
+  """Like open(path, mode) for writing, 'w' or 'wb', compressing by extension."""
+  opener = compression_opener(path)
+  if opener is None:
+    return open(path, mode, encoding=encoding)
+  binary = opener(path, 'wb')
+  if mode == 'wb':
+    return binary
+  return io.TextIOWrapper(binary, encoding=encoding or 'utf-8')
+
+
+class BackgroundReader(io.RawIOBase):
+  """Reads a file object in a background thread, a few chunks ahead of whoever is reading from this."""
+
+  def __init__(self, fileobj, chunk_size=READ_CHUNK_SIZE, chunks_ahead=8):
+    self._chunks = queue.Queue(chunks_ahead)
+    self._buffer = memoryview(b"")
+    self._eof = False
+    self._stopped = threading.Event()
+    self._thread = threading.Thread(target=self._read_ahead, args=(fileobj, chunk_size), daemon=True)
+    self._thread.start()
+
+  def _read_ahead(self, fileobj, chunk_size):
+    try:
+      with fileobj:
+        while not self._stopped.is_set():
+          chunk = fileobj.read(chunk_size)
+          self._chunks.put(chunk)
+          if not chunk:
+            return
+    except BaseException as e:
+      self._chunks.put(e)
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    while not self._buffer and not self._eof:
+      chunk = self._chunks.get()
+      if isinstance(chunk, BaseException):
+        raise chunk
+      if not chunk:
+        self._eof = True
+      self._buffer = memoryview(chunk)
+    size = min(len(buffer), len(self._buffer))
+    buffer[:size] = self._buffer[:size]
+    self._buffer = self._buffer[size:]
+    return size
+
+  def close(self):
+    if not self.closed:
+      self._stopped.set()
+      # unblock the reader thread if it's waiting for room in the queue
+      while self._thread.is_alive():
+        try:
+          self._chunks.get(timeout=0.1)
+        except queue.Empty:
+          pass
+    super().close()
@@ -0,0 +1,236 @@
+"""Patches between two builds of the main output or the lemmatization table, so a new build can be
+shipped as the words which changed instead of the whole file.
+
+  python dictionary_patch.py diff --old old.jsonl --new new.jsonl --patch patch.jsonl
+  python dictionary_patch.py apply --old old.jsonl --patch patch.jsonl --output new.jsonl
+
+Both files are [word, value] lines. Neither is loaded: the old file is read once for a content hash
+and position per word, the new file twice, once to compare hashes and once to write the patch. A
+patch is JSON Lines too, a header and then one line per difference, in the order of the new file:
+
+  ["+", word, after, value]  word was added
+  ["~", word, after, value]  word's value changed
+  [">", word, after, value]  word is the same but moved, relative to the other unchanged words
+  ["-", word]                word was removed
+
+`after` is the word before it in the new file (null for the first line), and value is copied from the
+new file as it is, so applying a patch gives back the new file byte for byte. Words which stay in
+place aren't in the patch, the fewest possible words are reported as moved. The header has the line
+count and hash of both files, apply_patch checks them.
+"""
+
+import argparse
+import hashlib
+import json
+from json.decoder import scanstring
+
+from compressed_io import open_input, open_output
+
+FORMAT = "wiktextract-cleanup-patch"
+VERSION = 1
+
+
+def split_line(line):
+  """(word, rest) for a '["word", value]' line, rest being 'value]' as it is in the line."""
+  if not line.startswith('["'):
+    raise Exception(f"not a [word, value] line: {line[:80]!r}")
+  word, end = scanstring(line, 2)
+  if line[end:end + 2] != ", ":
+    raise Exception(f"not a [word, value] line: {line[:80]!r}")
+  return word, line[end + 2:]
+
+
+def line_digest(line):
+  return hashlib.blake2b(line.encode(), digest_size=16).digest()
+
+
+def read_lines(path):
+  with open_input(path, 'r') as file:
+    for line in file:
+      yield line.rstrip("\n")
+
+
+def index_lines(path):
+  """{word: line digest followed by the line's position} and the file's hash. The two are packed in one
+  bytes object to keep the index small."""
+  index = {}
+  file_digest = hashlib.blake2b(digest_size=16)
+  for position, line in enumerate(read_lines(path)):
+    word, _ = split_line(line)
+    index[word] = line_digest(line) + position.to_bytes(5, 'little')
+    file_digest.update(line.encode() + b"\n")
+  return index, file_digest.hexdigest()
+
+
+def longest_increasing(positions):
+  """Indexes into positions of a longest strictly increasing subsequence."""
+  tails, tail_indexes, previous = [], [], [None] * len(positions)
+  for i, position in enumerate(positions):
+    # binary search for the first tail >= position
+    low, high = 0, len(tails)
+    while low < high:
+      middle = (low + high) // 2
+      if tails[middle] < position:
+        low = middle + 1
+      else:
+        high = middle
+    previous[i] = tail_indexes[low - 1] if low else None
+    if low == len(tails):
+      tails.append(position)
+      tail_indexes.append(i)
+    else:
+      tails[low] = position
+      tail_indexes[low] = i
+  result = []
+  i = tail_indexes[-1] if tail_indexes else None
+  while i is not None:
+    result.append(i)
+    i = previous[i]
+  return result[::-1]
+
+
+def write_patch(old_path, new_path, patch_path):
+  """Writes the patch from old_path to new_path, returns the number of words added, changed, moved
+  and removed."""
+  old_index, old_digest = index_lines(old_path)
+
+  # first pass over the new file: which words are unchanged, and where they were in the old file
+  unchanged_words, unchanged_positions = [], []
+  new_digest = hashlib.blake2b(digest_size=16)
+  new_lines = 0
+  for line in read_lines(new_path):
+    word, _ = split_line(line)
+    old = old_index.get(word)
+    if old and old[:16] == line_digest(line):
+      unchanged_words.append(word)
+      unchanged_positions.append(int.from_bytes(old[16:], 'little'))
+    new_digest.update(line.encode() + b"\n")
+    new_lines += 1
+  # the unchanged words which stay in place are the longest run in the same order as before
+  in_place = {unchanged_words[i] for i in longest_increasing(unchanged_positions)}
+  del unchanged_words, unchanged_positions
+
+  counts = {"added": 0, "changed": 0, "moved": 0, "removed": 0}
+  with open_output(patch_path, 'w') as outfile:
+    header = {"format": FORMAT, "version": VERSION, "old_lines": len(old_index), "old_hash": old_digest,
+      "new_lines": new_lines, "new_hash": new_digest.hexdigest()}
+    outfile.write(json.dumps(header) + "\n")
+
+    after = None
+    for line in read_lines(new_path):
+      word, rest = split_line(line)
+      old = old_index.pop(word, None)
+      if word not in in_place:
+        if old is None:
+          op, count = "+", "added"
+        elif old[:16] != line_digest(line):
+          op, count = "~", "changed"
+        else:
+          op, count = ">", "moved"
+        # the value is copied as it is, rest ends with the line's closing bracket
+        outfile.write(f"[{json.dumps(op)}, {json.dumps(word)}, {json.dumps(after)}, {rest}\n")
+        counts[count] += 1
+      after = word
+
+    # whatever wasn't in the new file
+    for word in old_index:
+      outfile.write(json.dumps(["-", word]) + "\n")
+      counts["removed"] += 1
+  return counts
+
+
+def read_patch(patch_path):
+  """The header, {after: (word, value)} for added, changed and moved words, and the set of words which
+  aren't copied from the old file."""
+  inserts = {}
+  dropped = set()
+  with open_input(patch_path, 'r') as file:
+    header = json.loads(next(file))
+    if header.get("format") != FORMAT or header.get("version") != VERSION:
+      raise Exception(f"{patch_path} isn't a version {VERSION} patch")
+    for line in file:
+      line = line.rstrip("\n")
+      op, rest = split_line(line)
+      if op == "-":
+        dropped.add(json.loads(line)[1])
+        continue
+      if rest[0] != '"':
+        raise Exception(f"invalid patch line: {line[:80]!r}")
+      word, end = scanstring(rest, 1)
+      rest = rest[end + 2:]
+      if rest.startswith("null, "):
+        after, value = None, rest[len("null, "):]
+      else:
+        after, end = scanstring(rest, 1)
+        value = rest[end + 2:]
+      inserts[after] = (word, value)
+      if op != "+":
+        dropped.add(word)
+  return header, inserts, dropped
+
+
+def apply_patch(old_path, patch_path, output_path):
+  """Writes the new file from the old file and a patch from write_patch."""
+  header, inserts, dropped = read_patch(patch_path)
+  old_digest, new_digest = hashlib.blake2b(digest_size=16), hashlib.blake2b(digest_size=16)
+  old_lines = new_lines = 0
+
+  with open_output(output_path, 'w') as outfile:
+    def write(line):
+      nonlocal new_lines
+      outfile.write(line + "\n")
+      new_digest.update(line.encode() + b"\n")
+      new_lines += 1
+
+    def write_inserted_after(word):
+      while word in inserts:
+        word, value = inserts.pop(word)
+        write(f"[{json.dumps(word)}, {value}")
+
+    write_inserted_after(None)
+    for line in read_lines(old_path):
+      old_digest.update(line.encode() + b"\n")
+      old_lines += 1
+      word, _ = split_line(line)
+      if word not in dropped:
+        write(line)
+        write_inserted_after(word)
+
+  if (old_lines, old_digest.hexdigest()) != (header["old_lines"], header["old_hash"]):
+    raise Exception(f"{old_path} isn't the file {patch_path} was made from")
+  if inserts or (new_lines, new_digest.hexdigest()) != (header["new_lines"], header["new_hash"]):
+    raise Exception(f"applying {patch_path} didn't give the expected file")
+
+
+def patch_path(path):
+  """Where cleanup.py writes the patch for an output, eg. output.patch.jsonl for output.jsonl."""
+  for extension in (".jsonl", ".json"):
+    index = path.rfind(extension)
+    if index >= 0:
+      return path[:index] + ".patch" + path[index:]
+  return path + ".patch"
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Make or apply a patch between two builds of the main output or the lemmatization table.')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+  diff_parser = subparsers.add_parser('diff', help='Write the patch from an old file to a new one')
+  diff_parser.add_argument('--old', type=str, required=True, help='The earlier build')
+  diff_parser.add_argument('--new', type=str, required=True, help='The new build')
+  diff_parser.add_argument('--patch', type=str, required=True, help='The path of the patch to write')
+  apply_parser = subparsers.add_parser('apply', help='Apply a patch to the file it was made from')
+  apply_parser.add_argument('--old', type=str, required=True, help='The earlier build')
+  apply_parser.add_argument('--patch', type=str, required=True, help='The patch')
+  apply_parser.add_argument('--output', type=str, required=True, help='The path of the new file to write')
+  args = parser.parse_args()
+
+  if args.command == 'diff':
+    counts = write_patch(args.old, args.new, args.patch)
+    print(f"wrote patch to {args.patch}: " + ", ".join(f"{n} {name}" for name, n in counts.items()))
+  else:
+    apply_patch(args.old, args.patch, args.output)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,85 @@
+"""SQLite version of the main output, to look words up without reading the whole file.
+
+Each word's entries are stored as the same JSON as on its line in the JSONL output, in a table with
+the word, the lowercased word and the output position, plus a table of (form_of, word) pairs. All of
+them are indexed, so lookups are O(log n) and only touch the pages they need.
+"""
+
+import os
+import sqlite3
+
+import json_codec
+
+
+def write_dictionary_store(path, items):
+  """Writes (word, entries) pairs, eg. all_entries_matching_word.items(), to a new database at path."""
+  new_path = path + ".new"
+  if os.path.exists(new_path):
+    os.remove(new_path)
+  db = sqlite3.connect(new_path)
+  db.execute("PRAGMA journal_mode = OFF")
+  db.execute("PRAGMA synchronous = OFF")
+  db.execute("CREATE TABLE entries (position INTEGER PRIMARY KEY, word TEXT NOT NULL, lowercase_word TEXT NOT NULL, entries TEXT NOT NULL)")
+  db.execute("CREATE TABLE form_of (form_of TEXT NOT NULL, word TEXT NOT NULL)")
+
+  form_of_pairs = []
+  def rows():
+    for position, (word, entries) in enumerate(items):
+      for form_of in dict.fromkeys(defin['form_of'] for defin in entries if defin.get('form_of')):
+        form_of_pairs.append((form_of, word))
+      yield position, word, word.lower(), json_codec.dumps(entries)
+  db.executemany("INSERT INTO entries VALUES (?, ?, ?, ?)", rows())
+  db.executemany("INSERT INTO form_of VALUES (?, ?)", form_of_pairs)
+
+  # indexes are built after inserting, that's much faster than keeping them up to date row by row
+  db.execute("CREATE UNIQUE INDEX entries_word ON entries (word)")
+  db.execute("CREATE INDEX entries_lowercase_word ON entries (lowercase_word)")
+  db.execute("CREATE INDEX form_of_form_of ON form_of (form_of)")
+  db.commit()
+  db.close()
+  os.replace(new_path, path)
+
+
+class DictionaryStore:
+  """Reads a database written by write_dictionary_store."""
+
+  def __init__(self, path):
+    # read only, so it can't be created by accident and several processes can read at once
+    self.db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+  def close(self):
+    self.db.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def __len__(self):
+    return self.db.execute("SELECT count(*) FROM entries").fetchone()[0]
+
+  def __contains__(self, word):
+    return self.db.execute("SELECT 1 FROM entries WHERE word = ?", (word,)).fetchone() is not None
+
+  def entries(self, word):
+    """The entries of word, like on its line of the JSONL output, or None if there aren't any."""
+    row = self.db.execute("SELECT entries FROM entries WHERE word = ?", (word,)).fetchone()
+    return json_codec.loads(row[0]) if row else None
+
+  def entries_lowercase(self, word):
+    """[word, entries] for every word which is the same as word when lowercased, in output order."""
+    rows = self.db.execute("SELECT word, entries FROM entries WHERE lowercase_word = ? ORDER BY position",
+      (word.lower(),))
+    return [[word, json_codec.loads(entries)] for word, entries in rows]
+
+  def words_with_form_of(self, lemma):
+    """Words which have an entry with this form_of, in output order."""
+    rows = self.db.execute("SELECT form_of.word FROM form_of JOIN entries ON entries.word = form_of.word"
+      " WHERE form_of = ? ORDER BY position", (lemma,))
+    return [word for word, in rows]
+
+  def items(self):
+    """All [word, entries] in output order."""
+    for word, entries in self.db.execute("SELECT word, entries FROM entries ORDER BY position"):
+      yield [word, json_codec.loads(entries)]
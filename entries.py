@@ -0,0 +1,110 @@
+"""Compact in-memory versions of the entry and definition dicts built by parse_entry.
+
+There are millions of these, and as dicts each one carries its own hash table for the same handful of
+keys, its own copy of strings like the pos and labels, and a list for every sequence. Entry and
+Definition keep their fields in __slots__ instead, share equal pos, f_pos, gender, label, word and
+form_of values, and post-processing stores forms and definitions as tuples.
+
+They support the subset of the dict interface the passes use (get, [], [] =, in), and remember the
+order their keys were set in, so `to_json` returns the same dict, with the same key order, parse_entry
+used to build. json_codec.dumps calls it, so conversion back to plain dicts only happens at write time.
+"""
+
+import sys
+
+# shared key orders, one tuple per distinct order
+_SHAPES = {}
+# shared gender tuples
+_TUPLES = {}
+
+
+def _shape(keys):
+  return _SHAPES.setdefault(keys, keys)
+
+
+def intern_tuple(value):
+  value = tuple(value)
+  return _TUPLES.setdefault(value, value)
+
+
+class Record:
+  """Base class for the slotted records, subclasses list their fields in __slots__ and say how values
+  of a field are shared in INTERN."""
+
+  __slots__ = ("_keys",)
+  INTERN = {}
+
+  def __init__(self, fields):
+    """fields is a dict, in the key order of the JSON output."""
+    intern = self.INTERN
+    for key, value in fields.items():
+      setattr(self, key, intern[key](value) if key in intern else value)
+    self._keys = _shape(tuple(fields))
+
+  def get(self, key, default=None):
+    return getattr(self, key) if key in self._keys else default
+
+  def __getitem__(self, key):
+    if key in self._keys:
+      return getattr(self, key)
+    raise KeyError(key)
+
+  def __setitem__(self, key, value):
+    if key in self.INTERN:
+      value = self.INTERN[key](value)
+    setattr(self, key, value)
+    if key not in self._keys:
+      self._keys = _shape(self._keys + (key,))
+
+  def __contains__(self, key):
+    return key in self._keys
+
+  def keys(self):
+    return self._keys
+
+  def to_json(self):
+    return {key: getattr(self, key) for key in self._keys}
+
+  # equal like the dicts they replace, list.remove in merge_reflexive_entries relies on it
+  def __eq__(self, other):
+    if not isinstance(other, Record):
+      return NotImplemented
+    return self.to_json() == other.to_json()
+
+  __hash__ = None
+
+  def __repr__(self):
+    return f"{type(self).__name__}({self.to_json()!r})"
+
+  def __getstate__(self):
+    return self._keys, tuple(getattr(self, key) for key in self._keys)
+
+  def __setstate__(self, state):
+    # values are interned again, so entries parsed in worker processes or read back from a spill
+    # file share them as well. Same as __init__, without building a dict first.
+    keys, values = state
+    intern = self.INTERN
+    for key, value in zip(keys, values):
+      setattr(self, key, intern[key](value) if key in intern else value)
+    self._keys = _shape(keys)
+
+
+class Definition(Record):
+  __slots__ = ("label", "definition", "gloss")
+  INTERN = {"label": sys.intern}
+
+
+class Entry(Record):
+  """One sense group of a wiktextract entry. Until rewrite_entries the entries parsed from
+  one input line share a single forms list, which process_reflexive_defin appends to, so forms only
+  become tuples in that pass."""
+
+  __slots__ = ("word", "pos", "f_pos", "forms", "full_forms", "from_forms", "form_of", "from_alt_of",
+    "definitions", "gender")
+  INTERN = {
+    "word": sys.intern,
+    "pos": sys.intern,
+    "f_pos": sys.intern,
+    "form_of": sys.intern,
+    "gender": intern_tuple,
+  }
@@ -0,0 +1,208 @@
+"""Processes several languages from the full kaikki.org dump in one read, instead of filtering the dump
+once per language and running cleanup.py on each filtered file.
+
+  python fan_out.py --input raw-wiktextract-data.jsonl.gz --languages es,pt --output-dir out
+
+The dump is read once in this process. Every line is checked for "lang_code": "<code>" of one of the
+languages as bytes, without decoding it, and lines which match are sent in batches to a worker process
+per language. Each worker decodes its lines, drops those where the match was only in a nested field
+(eg. a translation), and parses them with that language's tables (see languages.py). Once the whole
+dump is read the workers post-process and write their outputs at the same time:
+
+  out/<code>.jsonl        the dictionary, like cleanup.py's output
+  out/<code>.lemmas.txt   with --lemma-lists
+  out/<code>.table.jsonl  with --lemmatization-tables
+
+Only Spanish is supported: languages.py only has Spanish's tables, other languages are parsed with
+those and without the reflexive verb merging, which works as far as their wiktextract pos names and
+tags are the same, but nobody has checked the output. Lemmatization tables use CDE and SRG for Spanish
+when --cde-input and --srg-input-dir are given, the other languages' tables only have the wiktionary
+data.
+"""
+
+import argparse
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import json_codec
+import languages
+from compressed_io import open_input, open_output
+from output_writer import write_jsonl
+from process_dictionary import (
+  forkserver_context,
+  group_entries,
+  lemma_contributions_by_word,
+  lemma_list,
+  parse_entry,
+  post_process_entries,
+  wiktionary_lemmatizations,
+)
+
+BATCH_SIZE = 4 * 1024 * 1024
+# batches waiting for each worker, so reading can't get too far ahead of a slow language
+BATCHES_IN_FLIGHT = 4
+
+
+def language_code_pattern(codes):
+  """Matches "lang_code": "<code>" for any of codes, and captures the code."""
+  alternatives = b"|".join(re.escape(code.encode()) for code in codes)
+  return re.compile(rb'"lang_code":\s*"(' + alternatives + rb')"')
+
+
+# the worker process' state, each worker only handles one language
+_worker = None
+
+
+class LanguageWorker:
+  def __init__(self, code, codec, options):
+    json_codec.use(codec)
+    languages.use(code)
+    self.code = code
+    self.options = options
+    self.parsed_entries = []
+    self.lines = 0
+
+  def parse(self, lines):
+    for line in lines:
+      entry = json_codec.loads(line)
+      if entry.get("lang_code") == self.code:
+        self.parsed_entries.extend(parse_entry(entry))
+        self.lines += 1
+
+  def finish(self):
+    options = self.options
+    all_entries_matching_word = group_entries(self.parsed_entries)
+    self.parsed_entries = None
+    lemma_index = post_process_entries(all_entries_matching_word)
+    lemma_contributions = lambda: lemma_contributions_by_word(all_entries_matching_word.items(), lemma_index)
+
+    write_jsonl(self.output_path("jsonl"), all_entries_matching_word.items())
+
+    if options["lemma_lists"]:
+      lemma_set = lemma_list(lemma_contributions)
+      with open_output(self.output_path("lemmas.txt"), 'w') as outfile:
+        for lemma in lemma_set:
+          outfile.write(lemma + "\n")
+
+    if options["lemmatization_tables"]:
+      # imported here since they're only needed for the tables
+      from lemma_sources import LemmaSources, load_lemma_sources
+      if self.code == "es" and options["cde_input"]:
+        sources = load_lemma_sources(options["cde_input"], options["srg_input_dir"], options["lemma_sources_cache"])
+      else:
+        sources = LemmaSources.from_forms_lemmas({})
+      table = sources.lemmatization_table(wiktionary_lemmatizations(lemma_contributions()))
+      write_jsonl(self.output_path("table.jsonl"), table.items())
+
+    return {"lines": self.lines, "words": len(all_entries_matching_word)}
+
+  def output_path(self, extension):
+    return os.path.join(self.options["output_dir"], f"{self.code}.{extension}")
+
+
+def start_worker(code, codec, options):
+  global _worker
+  _worker = LanguageWorker(code, codec, options)
+
+
+def parse_lines(lines):
+  _worker.parse(lines)
+
+
+def finish_worker():
+  return _worker.finish()
+
+
+def fan_out(input_file, codes, options):
+  """Reads input_file once and processes the lines of each language in codes in its own process.
+  Returns {code: {"lines": lines parsed, "words": words written}}."""
+  pattern = language_code_pattern(codes)
+  # the workers are only started on the first submit, when the input's reader thread and the other
+  # pools' threads are running, so they're started from a fork server (see parse_pool)
+  context = forkserver_context()
+  pools = {code: ProcessPoolExecutor(1, mp_context=context, initializer=start_worker, initargs=(code, json_codec.name, options))
+    for code in codes}
+  try:
+    batches = {code: [] for code in codes}
+    batch_sizes = {code: 0 for code in codes}
+    pending = {code: deque() for code in codes}
+
+    def submit(code):
+      pending[code].append(pools[code].submit(parse_lines, batches[code]))
+      batches[code], batch_sizes[code] = [], 0
+      if len(pending[code]) > BATCHES_IN_FLIGHT:
+        # also raises the worker's exception if parsing failed
+        pending[code].popleft().result()
+
+    with open_input(input_file, 'rb') as infile:
+      for line in infile:
+        matches = pattern.findall(line)
+        if not matches:
+          continue
+        for code in set(matches) if len(matches) > 1 else matches:
+          code = code.decode()
+          batches[code].append(line)
+          batch_sizes[code] += len(line)
+          if batch_sizes[code] >= BATCH_SIZE:
+            submit(code)
+    print("finished reading input file")
+
+    for code in codes:
+      submit(code)
+    finished = {code: pools[code].submit(finish_worker) for code in codes}
+    results = {}
+    for code in codes:
+      while pending[code]:
+        pending[code].popleft().result()
+      results[code] = finished[code].result()
+    return results
+  finally:
+    for pool in pools.values():
+      pool.shutdown(cancel_futures=True)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Process several languages from the full wiktextract dump in a single read.')
+  parser.add_argument('--input', type=str, required=True, help='The path of the full wiktextract dump, or any file with entries in several languages')
+  parser.add_argument('--languages', type=str, required=True, help='Comma separated language codes, eg. es,pt')
+  parser.add_argument('--output-dir', type=str, required=True, help='Directory for the outputs, named after the language codes')
+  parser.add_argument('--lemma-lists', action='store_true', help='Also write a list of lemmas for each language')
+  parser.add_argument('--lemmatization-tables', action='store_true', help='Also write a lemmatization table for each language')
+  parser.add_argument('--cde-input', type=str, required=False, help='Corpus del Español forms list, for the Spanish lemmatization table')
+  parser.add_argument('--srg-input-dir', type=str, required=False, help='Spanish Resource Grammar inflections list dir, for the Spanish lemmatization table')
+  parser.add_argument('--lemma-sources-cache', type=str, required=False, help='File to keep a compact snapshot of the CDE and SRG data in between runs')
+  parser.add_argument('--json-codec', choices=json_codec.CODECS, default='auto', help='JSON library to decode the input with, auto uses orjson or msgspec if installed')
+  args = parser.parse_args()
+
+  codes = list(dict.fromkeys(code.strip() for code in args.languages.split(",") if code.strip()))
+  if not codes:
+    raise Exception("--languages needs at least one language code")
+  for code in codes:
+    if not re.fullmatch(r"[a-z-]+", code):
+      raise Exception(f"invalid language code {code}")
+    if code not in languages.LANGUAGES:
+      print(f"note: only Spanish is supported, {code} is processed with Spanish's tables and no reflexive verb merging, check its output")
+  if bool(args.cde_input) != bool(args.srg_input_dir):
+    raise Exception("--cde-input and --srg-input-dir have to be given together")
+  if args.cde_input and not args.lemmatization_tables:
+    raise Exception("--cde-input and --srg-input-dir are only used with --lemmatization-tables")
+  json_codec.use(args.json_codec)
+  os.makedirs(args.output_dir, exist_ok=True)
+
+  options = {
+    "output_dir": args.output_dir,
+    "lemma_lists": args.lemma_lists,
+    "lemmatization_tables": args.lemmatization_tables,
+    "cde_input": args.cde_input,
+    "srg_input_dir": args.srg_input_dir,
+    "lemma_sources_cache": args.lemma_sources_cache,
+  }
+  results = fan_out(args.input, codes, options)
+  for code, result in results.items():
+    print(f"{code}: {result['lines']} entries, wrote {result['words']} words to {args.output_dir}")
+
+
+if __name__ == "__main__":
+  main()
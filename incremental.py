@@ -0,0 +1,197 @@
+"""On-disk cache for incremental rebuilds.
+
+kaikki.org dumps change very little from week to week, so with --incremental-cache the parse output
+of every input line is cached keyed on a hash of the raw line, and only the lines which changed since
+the last run are parsed again, with or without --streaming. The cache is versioned on the source of the
+code that produced it, so changing the parsing code throws the stale cache away.
+
+Post-processing isn't cached: the from_forms insertion follows form_of chains and forms through the
+whole dictionary, and the part --streaming runs per neighbourhood is quicker to run again than its
+result is to load.
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import entries
+import json_codec
+import process_dictionary
+from compressed_io import open_input
+from scheduler import run_ahead
+
+# how many values the cache reads ahead looking for a key before looking it up in the index
+READ_AHEAD = 1000
+# size of the chunks of lines looked up at once without workers
+CHUNK_SIZE = 256 * 1024
+
+
+@contextmanager
+def open_parse_cache(cache_dir):
+  """The parse cache in cache_dir, committed when the block is done, or None without a cache_dir."""
+  if not cache_dir:
+    yield None
+    return
+  os.makedirs(cache_dir, exist_ok=True)
+  cache = Cache(os.path.join(cache_dir, "parsed.sqlite"), "parse", code_version(process_dictionary, entries))
+  try:
+    yield cache
+    cache.commit()
+    print(f"{cache.name} cache: {cache.hits} hits, {cache.misses} misses")
+  finally:
+    cache.close()
+
+
+def code_version(*modules):
+  digest = hashlib.blake2b(sys.version.encode(), digest_size=16)
+  for module in modules:
+    with open(module.__file__, 'rb') as file:
+      digest.update(file.read())
+  return digest.hexdigest()
+
+
+def content_key(*chunks):
+  digest = hashlib.blake2b(digest_size=16)
+  for chunk in chunks:
+    digest.update(len(chunk).to_bytes(8, 'little'))
+    digest.update(chunk)
+  return digest.digest()
+
+
+class Cache:
+  """Key-value cache in sqlite, updated in place.
+
+  Values are kept in the order they were put in, which for the parse cache is the order of the lines
+  in the input. Since that barely changes between dumps, get reads the cache in that order alongside
+  the input instead of looking every key up, and only looks keys which aren't in the next READ_AHEAD
+  values (lines which were added or moved) up in the index. Only values which aren't in the cache
+  yet are written, and on commit the ones which weren't used in this run are deleted, so values for
+  lines which are no longer in the input don't pile up."""
+
+  def __init__(self, path, name, version):
+    self.name = name
+    self.hits = 0
+    self.misses = 0
+    self.db = open_versioned(path, version)
+    # it's only a cache, so it isn't synced to disk
+    self.db.execute("PRAGMA synchronous = OFF")
+    # values put in this run come after last_rowid, so the scan never sees them
+    self.last_rowid = self.db.execute("SELECT max(rowid) FROM cache").fetchone()[0] or 0
+    self.scan = self.db.execute("SELECT rowid, key, value FROM cache WHERE rowid <= ? ORDER BY rowid", (self.last_rowid,))
+    # key -> (rowid, value) of the values read ahead and not used yet, in rowid order
+    self.read_ahead = OrderedDict()
+    self.skipped = []
+    self.looked_up = set()
+
+  def get(self, key):
+    """The value of key, or None if it isn't in the cache."""
+    row = self.read_ahead.pop(key, None)
+    while row is None and len(self.read_ahead) < READ_AHEAD:
+      next_row = self.scan.fetchone()
+      if next_row is None:
+        break
+      rowid, row_key, value = next_row
+      if row_key == key:
+        row = rowid, value
+      else:
+        self.read_ahead[row_key] = rowid, value
+
+    if row is not None:
+      # the values before it were skipped in the input, they're deleted on commit unless they're
+      # looked up later
+      while self.read_ahead and next(iter(self.read_ahead.values()))[0] < row[0]:
+        self.skipped.append(self.read_ahead.popitem(last=False)[1][0])
+    else:
+      # a new cache has nothing to look up
+      row = self.last_rowid and self.db.execute("SELECT rowid, value FROM cache WHERE key = ?", (key,)).fetchone()
+      if not row:
+        self.misses += 1
+        return None
+      self.looked_up.add(row[0])
+    self.hits += 1
+    return row[1]
+
+  def put(self, key, value):
+    self.db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?)", (key, value))
+
+  def commit(self):
+    unused = self.skipped + [rowid for rowid, _ in self.read_ahead.values()] + [rowid for rowid, _, _ in self.scan]
+    self.db.executemany("DELETE FROM cache WHERE rowid = ?", ((rowid,) for rowid in unused if rowid not in self.looked_up))
+    self.db.commit()
+
+  def close(self):
+    self.db.close()
+
+
+def open_versioned(path, version):
+  """Connects to the cache at path, starting it from scratch if it was written by other code or isn't a
+  cache at all."""
+  db = sqlite3.connect(path)
+  try:
+    stored_version = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+  except sqlite3.DatabaseError:
+    stored_version = None
+  if stored_version and stored_version[0] == version:
+    return db
+
+  db.close()
+  os.remove(path)
+  db = sqlite3.connect(path)
+  db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+  db.execute("CREATE TABLE cache (key BLOB PRIMARY KEY, value BLOB)")
+  db.execute("INSERT INTO meta VALUES ('version', ?)", (version,))
+  db.commit()
+  return db
+
+
+def parse_input_file_cached(input_file, parse_cache, workers=1):
+  """Same as process_dictionary.parse_input_file, but lines already in the parse cache aren't parsed."""
+  with open_input(input_file, 'rb') as infile:
+    if workers <= 1:
+      # parse_input_file reads one line at a time without workers, large chunks would add to the peak memory
+      for chunk in process_dictionary.read_line_chunks(infile, CHUNK_SIZE):
+        yield from parse_chunk_cached(chunk.splitlines(), parse_cache, None)
+      return
+
+    chunks = process_dictionary.read_line_chunks(infile, process_dictionary.PARSE_CHUNK_SIZE)
+    with process_dictionary.parse_pool(workers) as pool:
+      for parsed in run_ahead((parse_chunk_cached(chunk.splitlines(), parse_cache, pool) for chunk in chunks), 2 * workers):
+        yield from parsed
+
+
+def parse_chunk_cached(lines, parse_cache, pool):
+  keys = [content_key(line) for line in lines]
+  cached = [parse_cache.get(key) for key in keys]
+  misses = [line for line, data in zip(lines, cached) if data is None]
+  if pool and misses:
+    # parsed in the background and only collected when the result is iterated
+    get_parsed = pool.submit(pickle_parsed_lines, misses).result
+    get_new_entries = lambda: ((pickle.loads(data), data) for data in get_parsed())
+  else:
+    # parsed here, so the entries don't have to be unpickled again
+    parsed_misses = process_dictionary.parse_entries(json_codec.loads(line) for line in misses)
+    new_entries = [(line_entries, pickle.dumps(line_entries, pickle.HIGHEST_PROTOCOL)) for line_entries in parsed_misses]
+    get_new_entries = lambda: new_entries
+  return merge_cached_lines(keys, cached, get_new_entries, parse_cache)
+
+
+def merge_cached_lines(keys, cached, get_new_entries, parse_cache):
+  """Yields the entries of each line, unpickled from the cache or from get_new_entries, which gives
+  (entries, pickled entries) for each line which wasn't in the cache."""
+  new_entries = iter(get_new_entries())
+  for key, data in zip(keys, cached):
+    if data is None:
+      line_entries, data = next(new_entries)
+      parse_cache.put(key, data)
+      yield line_entries
+    else:
+      yield pickle.loads(data)
+
+
+def pickle_parsed_lines(lines):
+  return [pickle.dumps(parsed, pickle.HIGHEST_PROTOCOL)
+    for parsed in process_dictionary.parse_entries(json_codec.loads(line) for line in lines)]
@@ -0,0 +1,115 @@
+"""Lookup structures over all_entries_matching_word which are built once and then kept up to date
+as post-processing adds entries, instead of being recomputed for every entry."""
+
+
+class FormOfLemmaIndex:
+  """Resolves entries to the lemmas at the end of their form_of chains.
+
+  The walk from an entry only depends on its form_of target and pos (plus its own word, which is
+  dropped from the result afterwards), so the walk's result is memoized per (target, pos). Inside a
+  walk forms already visited are returned as lemmas themselves, so results inside form_of cycles
+  depend on where the walk started and aren't shared between different targets.
+
+  The walk is iterative, so long chains can't hit the recursion limit. Call `entry_added` whenever an
+  entry is appended to all_entries_matching_word so memoized walks which went through that word are
+  dropped."""
+
+  def __init__(self, entries):
+    self.entries = entries
+    self._resolved = {}
+    self._dependents = {}
+
+  def lemmas(self, defin):
+    """Same result as the original recursive find_lemmas_from_form_of_defin, including set order."""
+    form = defin.get("form_of")
+    if not form:
+      return {defin['word']}
+    elif form not in self.entries:
+      return {None}
+
+    key = (form, defin['pos'])
+    child_lemmas = self._resolved.get(key)
+    if child_lemmas is None:
+      child_lemmas, touched = walk_form_of(form, defin['pos'], self.entries)
+      self._resolved[key] = child_lemmas
+      for word in touched:
+        self._dependents.setdefault(word, set()).add(key)
+
+    child_lemmas = {lemma for lemma in child_lemmas if lemma != defin['word']}
+    return child_lemmas if child_lemmas else {None}
+
+  def entry_added(self, word):
+    for key in self._dependents.pop(word, ()):
+      self._resolved.pop(key, None)
+
+
+def walk_form_of(form, pos, entries):
+  """Collects the lemmas reachable from the entries of `form` with the same pos, and the words the
+  walk looked at. This is a depth-first walk with an explicit stack, adding lemmas to each level's set
+  one at a time in the same order as the recursive set comprehensions did, so the resulting sets
+  iterate in the same order too (which matters for tie-breaking in the lemmatization table)."""
+  visited = {form}
+  touched = {form}
+  # each frame is [entries being walked, index of the next entry, lemmas collected so far]
+  stack = [[entries.get(form), 0, set()]]
+  while True:
+    frame = stack[-1]
+    defins, i, lemmas = frame
+    if i < len(defins):
+      frame[1] += 1
+      defin = defins[i]
+      target = defin.get("form_of")
+      if target in visited:
+        lemmas.add(target)
+      elif defin['pos'] != pos:
+        pass
+      elif not target:
+        lemmas.add(defin['word'])
+      elif target not in entries:
+        touched.add(target)
+        lemmas.add(None)
+      else:
+        visited.add(target)
+        touched.add(target)
+        stack.append([entries.get(target), 0, set()])
+      continue
+
+    stack.pop()
+    result = lemmas if lemmas else {None}
+    if not stack:
+      return result, touched
+    parent_lemmas = stack[-1][2]
+    for lemma in result:
+      parent_lemmas.add(lemma)
+
+
+class FormsIndex:
+  """(word, pos) -> set of the forms of that word's entries with that pos, so checking whether a form
+  belongs to a lemma doesn't scan the forms lists of all its entries. Call `entry_added` whenever an
+  entry is appended to all_entries_matching_word. Starts empty without entries, so it can be built
+  while the entries are being rewritten. The sets are only for membership tests, don't modify them."""
+
+  EMPTY = frozenset()
+
+  def __init__(self, entries=None):
+    self._forms = {}
+    for word, defins in (entries or {}).items():
+      for defin in defins:
+        self.entry_added(word, defin)
+
+  def forms(self, word, pos):
+    return self._forms.get((word, pos), self.EMPTY)
+
+  def items(self):
+    """((word, pos), forms) for every word and pos which has forms."""
+    return self._forms.items()
+
+  def entry_added(self, word, defin):
+    forms = defin.get("forms")
+    if forms:
+      key = (word, defin.get("pos"))
+      word_forms = self._forms.get(key)
+      if word_forms is None:
+        self._forms[key] = set(forms)
+      else:
+        word_forms.update(forms)
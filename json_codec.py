@@ -0,0 +1,66 @@
+"""JSON decoding with orjson or msgspec when they're installed, falling back to the standard library.
+
+Only decoding goes through the fast codecs. Neither orjson nor msgspec can produce json.dumps' default
+", " and ": " separators and ASCII escapes, so encoding always uses the standard library to keep the
+output byte-for-byte the same whichever codec is installed. Objects with a to_json method, like the
+entries from entries.py, are encoded as what it returns."""
+
+import json
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  import msgspec
+except ImportError:
+  msgspec = None
+
+CODECS = ["auto", "orjson", "msgspec", "json"]
+
+
+def _to_json(obj):
+  # the compact entry types convert themselves back to the dicts they stand for
+  to_json = getattr(obj, "to_json", None)
+  if to_json is None:
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+  return to_json()
+
+
+# same settings as json.dumps' default encoder
+dumps = json.JSONEncoder(default=_to_json).encode
+
+
+def _orjson_loads(data):
+  try:
+    return orjson.loads(data)
+  except orjson.JSONDecodeError:
+    # orjson is stricter than json, eg. about lone surrogates and NaN
+    return json.loads(data)
+
+
+def _msgspec_loads(data):
+  try:
+    return msgspec.json.decode(data)
+  except msgspec.DecodeError:
+    return json.loads(data)
+
+
+def use(codec):
+  """Picks the codec used by `loads`, one of CODECS. Call it before starting any worker processes."""
+  global loads, name
+  if codec == "auto":
+    codec = "orjson" if orjson else "msgspec" if msgspec else "json"
+  if codec == "orjson" and orjson:
+    loads = _orjson_loads
+  elif codec == "msgspec" and msgspec:
+    loads = _msgspec_loads
+  elif codec == "json":
+    loads = json.loads
+  else:
+    raise Exception(f"json codec {codec} isn't installed")
+  name = codec
+
+
+use("auto")
@@ -0,0 +1,39 @@
+"""Per-language settings for parsing and post-processing.
+
+process_dictionary was written for Spanish and reads its tables from module globals. `use` swaps them
+for another language's, it's meant to be called once at the start of a process which only handles that
+language, like the fan_out.py workers.
+
+Only Spanish is supported, it's the only language with settings here. Every other language gets
+DEFAULT, which is Spanish's pos and tag tables without the reflexive verb merging. Wiktextract's pos
+names and tags are in English whatever the language, so this runs, but none of those outputs have
+been checked. Supporting a language means adding an entry to LANGUAGES with its own tables.
+"""
+
+import process_dictionary
+
+SPANISH = {
+  "pos_conversion": dict(process_dictionary.wiktionary_pos_conversion),
+  "tags_include_as_gloss": dict(process_dictionary.TAGS_INCLUDE_AS_GLOSS),
+  "merge_reflexive_verbs": True,
+}
+
+LANGUAGES = {
+  "es": SPANISH,
+}
+
+DEFAULT = {**SPANISH, "merge_reflexive_verbs": False}
+
+
+def settings(code):
+  return LANGUAGES.get(code, DEFAULT)
+
+
+def use(code):
+  language = settings(code)
+  # updated in place, other modules import these tables by name
+  process_dictionary.wiktionary_pos_conversion.clear()
+  process_dictionary.wiktionary_pos_conversion.update(language["pos_conversion"])
+  process_dictionary.TAGS_INCLUDE_AS_GLOSS.clear()
+  process_dictionary.TAGS_INCLUDE_AS_GLOSS.update(language["tags_include_as_gloss"])
+  process_dictionary.MERGE_REFLEXIVE_VERBS = language["merge_reflexive_verbs"]
@@ -0,0 +1,185 @@
+"""Compact snapshots of the Corpus del Español and SRG data for the lemmatization table.
+
+Reading CDE and every SRG file into nested dicts is slow and takes a lot of memory, and the files
+almost never change. So they're read once and reduced to the most frequent lemma for every (form, pos),
+and the result is saved as a snapshot which later runs load instead, as long as the files are the same.
+
+In a snapshot every distinct form and lemma is stored once in a string table, and the (form, pos)
+groups are parallel arrays of string indexes, pos indexes and frequencies. Groups are in the order
+the nested dicts had, so the lemmatization table keeps the same key order.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+from array import array
+from itertools import islice
+
+from compressed_io import open_input
+from incremental import code_version
+import process_dictionary
+from process_dictionary import davies_pos_conversion, srg_pos_conversion
+
+POS = ["a", "n", "r", "v", "o"]
+POS_INDEX = {pos: i for i, pos in enumerate(POS)}
+
+
+def load_lemma_sources(cde_input, srg_input_dir, snapshot_path=None):
+  """Returns the LemmaSources for these files, from the snapshot at snapshot_path if it's up to date.
+  Otherwise the files are read and, with a snapshot_path, the snapshot is (re)written."""
+  files = source_files(cde_input, srg_input_dir)
+  stats = [file_stat(path) for path in files]
+  version = code_version(process_dictionary, sys.modules[__name__])
+
+  digest = None
+  if snapshot_path and os.path.exists(snapshot_path):
+    with open(snapshot_path, 'rb') as file:
+      header = pickle.load(file)
+      if header['version'] == version and header['files'] == files:
+        if header['stats'] != stats:
+          # touched but maybe not changed, eg. copied or checked out again
+          digest = content_hash(files)
+        if header['stats'] == stats or header['hash'] == digest:
+          sources = LemmaSources(**pickle.load(file))
+          print(f"loaded CDE and SRG data from {snapshot_path}")
+          if header['stats'] != stats:
+            write_snapshot(snapshot_path, sources, version, files, stats, digest)
+          return sources
+
+  sources = read_lemma_sources(files)
+  if snapshot_path:
+    write_snapshot(snapshot_path, sources, version, files, stats, digest or content_hash(files))
+    print(f"wrote CDE and SRG snapshot to {snapshot_path}")
+  return sources
+
+
+def source_files(cde_input, srg_input_dir):
+  return [cde_input] + [srg_input_dir + name for name in os.listdir(srg_input_dir) if name != "verbs-nogros"]
+
+
+def file_stat(path):
+  stat = os.stat(path)
+  return (stat.st_size, stat.st_mtime_ns)
+
+
+def content_hash(files):
+  digest = hashlib.blake2b(digest_size=16)
+  for path in files:
+    with open(path, 'rb') as file:
+      while chunk := file.read(1024 * 1024):
+        digest.update(chunk)
+    digest.update(b"\0")
+  return digest.hexdigest()
+
+
+def write_snapshot(snapshot_path, sources, version, files, stats, digest):
+  # the default snapshot_path is in the --incremental-cache directory, which may not exist yet
+  os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+  new_path = snapshot_path + ".new"
+  with open(new_path, 'wb') as file:
+    pickle.dump({"version": version, "files": files, "stats": stats, "hash": digest}, file, pickle.HIGHEST_PROTOCOL)
+    pickle.dump(sources.state(), file, pickle.HIGHEST_PROTOCOL)
+  os.replace(new_path, snapshot_path)
+
+
+def read_lemma_sources(files):
+  cde_input, srg_files = files[0], files[1:]
+  forms_lemmas = {}
+
+  # I'm lowercasing everything, this is slightly problematic but is a fine model for lemmatization at least for spanish
+  with open_input(cde_input, "r", encoding="windows-1252") as file:
+    for line in islice(file, 8, None):
+      entry = line.split()
+      rank, lemma_freq, lemma, pos, form_freq, form, _ = entry
+      (form, lemma) = (form.lower(), lemma.lower())
+      pos = davies_pos_conversion[pos]
+      forms_lemmas.setdefault(form, {}).setdefault(pos, {})[lemma] = int(form_freq)
+
+  for filename in srg_files:
+    with open_input(filename, "r", encoding="windows-1252") as file:
+      for line in file:
+        form, lemma, tag = line.split()
+        (form, lemma) = (form.lower(), lemma.lower())
+        if "+" in lemma:
+          lemma = lemma.split("+")[0]
+        pos = srg_pos_conversion[tag[0]]
+        forms_lemmas.setdefault(form, {}).setdefault(pos, {}).setdefault(lemma, 0)
+        # srg doesn't have a line for the lemma pointing to itself
+        # in this case I'm prioritizing srg after wiktionary. this is kind of a toss-up
+        forms_lemmas.setdefault(lemma, {}).setdefault(pos, {}).setdefault(lemma, -1)
+
+  return LemmaSources.from_forms_lemmas(forms_lemmas)
+
+
+class LemmaSources:
+  """The most frequent CDE or SRG lemma for every (form, pos), as parallel arrays over a string table.
+
+  The only negative frequency is the -1 placeholder SRG lemmas get for themselves, so a group whose
+  best frequency is negative holds nothing but that placeholder, and any other lemma added to it
+  afterwards (with frequency 0) takes its place."""
+
+  def __init__(self, strings, forms, pos, lemmas, freqs):
+    self.strings = strings.split("\n") if isinstance(strings, str) else strings
+    self.forms = forms
+    self.pos = pos
+    self.lemmas = lemmas
+    self.freqs = freqs
+
+  @classmethod
+  def from_forms_lemmas(cls, forms_lemmas):
+    string_index = {}
+    forms, pos_indexes, lemmas, freqs = array('I'), array('B'), array('I'), array('i')
+    for form, pos_lemmas in forms_lemmas.items():
+      form_index = string_index.setdefault(form, len(string_index))
+      for pos, lemma_freqs in pos_lemmas.items():
+        # max() keeps the first of equally frequent lemmas like the stable sort did
+        lemma, freq = max(lemma_freqs.items(), key=lambda item: item[1])
+        if freq < 0 and lemma != form:
+          raise Exception(f"unexpected negative frequency for {form} -> {lemma}")
+        forms.append(form_index)
+        pos_indexes.append(POS_INDEX[pos])
+        lemmas.append(string_index.setdefault(lemma, len(string_index)))
+        freqs.append(freq)
+    return cls(list(string_index), forms, pos_indexes, lemmas, freqs)
+
+  def state(self):
+    return {"strings": "\n".join(self.strings), "forms": self.forms, "pos": self.pos,
+      "lemmas": self.lemmas, "freqs": self.freqs}
+
+  def form_frequencies(self):
+    """{form: CDE frequency}, the frequencies of the most frequent lemma for each of its pos added up.
+    Forms which are only in SRG aren't included."""
+    strings = self.strings
+    frequencies = {}
+    for form, freq in zip(self.forms, self.freqs):
+      if freq > 0:
+        form = strings[form]
+        frequencies[form] = frequencies.get(form, 0) + freq
+    return frequencies
+
+  def lemmatization_table(self, extra_lemmas=()):
+    """{form: {pos: lemma}} with the most frequent lemma, after adding (form, pos, lemma) triples from
+    extra_lemmas with frequency 0 wherever that form, pos and lemma isn't in the sources yet."""
+    strings = self.strings
+    table = {}
+    placeholders = set()
+    for form, pos, lemma, freq in zip(self.forms, self.pos, self.lemmas, self.freqs):
+      form, pos = strings[form], POS[pos]
+      lemmas = table.get(form)
+      if lemmas is None:
+        lemmas = table[form] = {}
+      lemmas[pos] = strings[lemma]
+      if freq < 0:
+        placeholders.add((form, pos))
+
+    for form, pos, lemma in extra_lemmas:
+      lemmas = table.get(form)
+      if lemmas is None:
+        table[form] = {pos: lemma}
+      elif pos not in lemmas:
+        lemmas[pos] = lemma
+      elif lemma != form and (form, pos) in placeholders:
+        lemmas[pos] = lemma
+        placeholders.remove((form, pos))
+    return table
@@ -0,0 +1,123 @@
+"""Binary lemmatization index which can be memory-mapped, and a Lemmatizer to look forms up in it.
+
+Loading the JSONL lemmatization table means parsing every line into a dict, which takes seconds and a
+lot of memory in every process that does it. The index is laid out so it can be used straight from an
+mmap without parsing anything, and the pages are shared between all processes which map the same file.
+
+Layout, all arrays are of uint32 in the byte order recorded in the header (see mmap_index.py):
+
+  header          MAGIC, byte order, then string, form, entry and slot counts (little endian)
+  string offsets  n_strings + 1 offsets into the string pool
+  forms           string ids of every form, sorted by their UTF-8 bytes
+  entry offsets   n_forms + 1 offsets into the entries, one range per form
+  entry lemmas    string id of the lemma for each entry
+  slots           open addressing hash table on the crc32 of the form, index in forms + 1 or 0 if empty
+  entry pos       one ASCII byte per entry, the f_pos of the entry
+  string pool     every distinct form and lemma, UTF-8, sorted, not separated
+
+Forms are looked up through the hash table, since a binary search takes a slice of the mmap at every
+step and is several times slower in Python. The forms array is sorted anyway so ranges of forms can be
+walked in order. Entries keep the order the pos keys had in the table.
+"""
+
+import json
+from array import array
+
+from compressed_io import open_input
+from mmap_index import MappedIndex, find_slot, hash_slots, header_struct, write_header
+
+MAGIC = b"LEMIDX01"
+HEADER = header_struct(4)
+
+
+def load_jsonl_table(path):
+  """The JSONL lemmatization table at path as {form: {pos: lemma}}, what the index replaces."""
+  table = {}
+  with open_input(path, 'r') as file:
+    for line in file:
+      form, lemmas = json.loads(line)
+      table[form] = lemmas
+  return table
+
+
+def write_lemmatization_index(path, pos_lookup_table):
+  """Writes {form: {pos: lemma}}, the lemmatization table, as a binary index to path."""
+  strings = set(pos_lookup_table)
+  for lemmas in pos_lookup_table.values():
+    strings.update(lemmas.values())
+  encoded = sorted(string.encode() for string in strings)
+  string_ids = {string.decode(): i for i, string in enumerate(encoded)}
+
+  string_offsets = array('I', [0])
+  for string in encoded:
+    string_offsets.append(string_offsets[-1] + len(string))
+
+  forms, entry_offsets, entry_lemmas, entry_pos = array('I'), array('I', [0]), array('I'), bytearray()
+  for form in sorted(pos_lookup_table, key=string_ids.__getitem__):
+    forms.append(string_ids[form])
+    for pos, lemma in pos_lookup_table[form].items():
+      if len(pos) != 1 or not pos.isascii():
+        raise Exception(f"can't store pos {pos!r} of {form} in a lemmatization index")
+      entry_lemmas.append(string_ids[lemma])
+      entry_pos += pos.encode()
+    entry_offsets.append(len(entry_lemmas))
+
+  slots = hash_slots([encoded[string_id] for string_id in forms])
+
+  with open(path, 'wb') as file:
+    write_header(file, HEADER, MAGIC, len(encoded), len(forms), len(entry_lemmas), len(slots))
+    for section in (string_offsets, forms, entry_offsets, entry_lemmas, slots):
+      section.tofile(file)
+    file.write(entry_pos)
+    file.write(b"".join(encoded))
+
+
+class Lemmatizer(MappedIndex):
+  """Looks forms up in a lemmatization index written by write_lemmatization_index.
+
+  Opening only maps the file, so it's cheap and the memory is shared between processes, eg. all the
+  workers of a server. Forms are looked up as given, the table only has lowercase forms."""
+
+  def __init__(self, path):
+    n_strings, n_forms, n_entries, n_slots = self._map(path, MAGIC, HEADER, "lemmatization index")
+    self._string_offsets = self._section(n_strings + 1)
+    self._forms = self._section(n_forms)
+    self._entry_offsets = self._section(n_forms + 1)
+    self._entry_lemmas = self._section(n_entries)
+    self._slots = self._section(n_slots)
+    self._entry_pos = self._section(n_entries, 'B')
+    self._pool = self._offset
+
+  def __len__(self):
+    return len(self._forms)
+
+  def _string_bytes(self, string_id):
+    return self._mmap[self._pool + self._string_offsets[string_id]:self._pool + self._string_offsets[string_id + 1]]
+
+  def _string(self, string_id):
+    return str(self._string_bytes(string_id), 'utf-8')
+
+  def _find(self, form):
+    """Index of form in the forms array, or -1."""
+    return find_slot(self._slots, form.encode(), self._form_bytes)
+
+  def _form_bytes(self, i):
+    return self._string_bytes(self._forms[i])
+
+  def lookup(self, form, pos=None):
+    """The lemmas of form as {pos: lemma}, like a value of the JSONL table, or with a pos just the
+    lemma for that pos. None if the form (or the form with that pos) isn't in the index."""
+    i = self._find(form)
+    if i < 0:
+      return None
+    start, end = self._entry_offsets[i], self._entry_offsets[i + 1]
+    if pos is None:
+      return {chr(self._entry_pos[j]): self._string(self._entry_lemmas[j]) for j in range(start, end)}
+    for j in range(start, end):
+      if chr(self._entry_pos[j]) == pos:
+        return self._string(self._entry_lemmas[j])
+    return None
+
+  def lookup_many(self, forms, pos=None):
+    """lookup for every form, as a list in the same order."""
+    return [self.lookup(form, pos) for form in forms]
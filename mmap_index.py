@@ -0,0 +1,85 @@
+"""What the memory-mapped binary indexes (lemmatizer.py, search_index.py) have in common.
+
+Both files are a header, MAGIC, byte order and a count per section, followed by the sections: arrays of
+uint32 in the byte order of the machine which wrote them, and byte strings. Keys are found through an
+open addressing hash table on their crc32, written by hash_slots.
+"""
+
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+
+
+def header_struct(n_counts):
+  """The header of a file with n_counts counts: MAGIC, byte order and then the counts, little endian."""
+  return struct.Struct("<8s8s" + "I" * n_counts)
+
+
+def write_header(file, header, magic, *counts):
+  file.write(header.pack(magic, sys.byteorder.encode().ljust(8), *counts))
+
+
+def hash_slots(keys):
+  """Hash table for keys (bytes), the index in keys + 1 of the key in each slot or 0 if it's empty.
+  It's at most half full, so probe sequences stay short."""
+  n_slots = 1
+  while n_slots < 2 * len(keys):
+    n_slots *= 2
+  slots = array('I', bytes(4 * n_slots))
+  for i, key in enumerate(keys):
+    slot = zlib.crc32(key) & (n_slots - 1)
+    while slots[slot]:
+      slot = (slot + 1) & (n_slots - 1)
+    slots[slot] = i + 1
+  return slots
+
+
+def find_slot(slots, key, key_at):
+  """Index of key in the hash table slots, or -1. key_at(i) is the key with index i."""
+  mask = len(slots) - 1
+  slot = zlib.crc32(key) & mask
+  while True:
+    i = slots[slot] - 1
+    if i < 0 or key_at(i) == key:
+      return i
+    slot = (slot + 1) & mask
+
+
+class MappedIndex:
+  """Base class of the readers. _map opens the file, then _section takes the sections one after the
+  other, and close releases them all."""
+
+  def _map(self, path, magic, header, description):
+    """Maps path and checks its header, returns the counts in it."""
+    with open(path, 'rb') as file:
+      self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    self._view = memoryview(self._mmap)
+    self._sections = []
+    file_magic, byteorder, *counts = header.unpack_from(self._view)
+    if file_magic != magic:
+      raise Exception(f"{path} isn't a {description}")
+    if byteorder.rstrip() != sys.byteorder.encode():
+      raise Exception(f"{path} was written on a {byteorder.decode().rstrip()} endian machine")
+    self._offset = header.size
+    return counts
+
+  def _section(self, length, format='I'):
+    size = length * (4 if format == 'I' else 1)
+    part = self._view[self._offset:self._offset + size].cast(format)
+    self._offset += size
+    self._sections.append(part)
+    return part
+
+  def close(self):
+    for section in self._sections:
+      section.release()
+    self._view.release()
+    self._mmap.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
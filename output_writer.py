@@ -0,0 +1,108 @@
+"""Writing the JSON Lines outputs, optionally encoded by several processes and split into shards.
+
+Encoding is most of the time it takes to write the output. With more than one worker, the pairs to
+write are put in a module global before the worker processes are forked, so the workers get them from
+the fork instead of having them pickled over, and each worker encodes a range of them. Encoded ranges
+are written in order, so the output is the same as with one worker. Fork isn't available everywhere,
+and iterators (eg. the --streaming entries) can't be split into ranges, in those cases the output is
+encoded in this process.
+
+With shards, every line goes to shard crc32(key as UTF-8) % shards, keeping its order within the
+shard, and a manifest describing the shards is written next to them.
+"""
+
+import json
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import json_codec
+from compressed_io import COMPRESSED_OPENERS, open_output
+from scheduler import run_ahead
+
+CHUNK_SIZE = 10000
+SHARD_KEY = "crc32 of the UTF-8 encoded word, modulo the number of shards"
+
+# what the forked workers encode, see encode_range
+_pairs = None
+_with_key = True
+_shards = 1
+
+
+def shard_of(key, shards):
+  return zlib.crc32(key.encode()) % shards
+
+
+def encode_pairs(pairs, with_key, shards):
+  """One string of lines for each shard."""
+  lines = [[] for _ in range(shards)]
+  for pair in pairs:
+    line = json_codec.dumps(pair if with_key else pair[1]) + "\n"
+    lines[shard_of(pair[0], shards) if shards > 1 else 0].append(line)
+  return ["".join(shard_lines) for shard_lines in lines]
+
+
+def encode_range(start, stop):
+  return encode_pairs(_pairs[start:stop], _with_key, _shards)
+
+
+def encoded_chunks(pairs, with_key, shards, workers):
+  global _pairs, _with_key, _shards
+  if workers > 1 and isinstance(pairs, list) and "fork" in multiprocessing.get_all_start_methods():
+    _pairs, _with_key, _shards = pairs, with_key, shards
+    try:
+      with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+        # only a couple of ranges per worker in flight, so encoded output doesn't pile up in memory
+        futures = (pool.submit(encode_range, start, start + CHUNK_SIZE) for start in range(0, len(pairs), CHUNK_SIZE))
+        for future in run_ahead(futures, 2 * workers):
+          yield future.result()
+    finally:
+      _pairs = None
+    return
+
+  pairs = iter(pairs)
+  while chunk := list(islice(pairs, CHUNK_SIZE)):
+    yield encode_pairs(chunk, with_key, shards)
+
+
+def shard_paths(path, shards):
+  compression = next((extension for extension in COMPRESSED_OPENERS if path.endswith(extension)), "")
+  root, extension = os.path.splitext(path[:len(path) - len(compression)])
+  return [f"{root}-{i:05}-of-{shards:05}{extension}{compression}" for i in range(shards)]
+
+
+def manifest_path(path):
+  compression = next((extension for extension in COMPRESSED_OPENERS if path.endswith(extension)), "")
+  return os.path.splitext(path[:len(path) - len(compression)])[0] + ".manifest.json"
+
+
+def write_jsonl(path, pairs, with_key=True, workers=1, shards=None):
+  """Writes (key, value) pairs, one JSON line each: [key, value], or just value without with_key.
+  With shards, the lines are split over that many files and a manifest. Returns the paths written."""
+  paths = shard_paths(path, shards) if shards else [path]
+  outfiles = [open_output(shard_path, 'w') for shard_path in paths]
+  line_counts = [0] * len(paths)
+  try:
+    for chunk in encoded_chunks(pairs, with_key, len(paths), workers):
+      for i, lines in enumerate(chunk):
+        if lines:
+          outfiles[i].write(lines)
+          line_counts[i] += lines.count("\n")
+  finally:
+    for outfile in outfiles:
+      outfile.close()
+
+  if shards:
+    manifest = {
+      "shards": shards,
+      "shard_key": SHARD_KEY,
+      "lines": sum(line_counts),
+      "files": [{"path": os.path.basename(shard_path), "lines": lines, "bytes": os.path.getsize(shard_path)}
+        for shard_path, lines in zip(paths, line_counts)],
+    }
+    with open(manifest_path(path), 'w') as outfile:
+      json.dump(manifest, outfile, indent=2)
+    paths.append(manifest_path(path))
+  return paths
@@ -1,147 +1,382 @@
-import json
 from collections import defaultdict
 
 import re
-from itertools import islice
+import sys
 import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
+import json_codec
+from compressed_io import open_input
+from entries import Definition, Entry
+from indexes import FormOfLemmaIndex, FormsIndex
+from scheduler import Scheduler, run_ahead
+from stats import NO_STATS
 
-def process_dictionary_data(input_file, no_post_process, lemmatization_table, cde_input, srg_input_dir, generate_lemma_list, no_wiktionary=False):
-    """Process dictionary data and return processed entries and optional lookup tables."""
-    try:
-      parsed_entries = []
-      all_entries_matching_word = defaultdict(list)
-      forms_lemmas = defaultdict(lambda: defaultdict(dict))
-      pos_lookup_table = {}
-      lemma_set = set()
-      reflexive_verbs = {}
 
-      with open(input_file, 'r') as infile:
-          for line in infile:
-              parsed_entries.extend(parse_entry(json.loads(line)))
-      print("finished loading and parsing input file")
+def process_dictionary_data(input_file, no_post_process, lemmatization_table, cde_input, srg_input_dir, generate_lemma_list, no_wiktionary=False, streaming=False, streaming_buckets=64, streaming_dir=None, workers=1, incremental_cache=None, lemma_sources_cache=None, stats=NO_STATS, write_entries=None, concurrent=True, checkpoint_dir=None, resume_from=None, search_vocabulary=False):
+    """Process dictionary data and return processed entries and optional lookup tables.
+
+    The steps are stages of a Scheduler, so the ones which don't depend on each other overlap: CDE and
+    SRG are read in another process while the dictionary is loaded and post-processed, and afterwards
+    the lemma list, the lemmatization table and write_entries (called with the final entries, if given)
+    run at the same time. Results are the same with concurrent=False, which runs them one by one.
 
-      for entry in parsed_entries:
-        all_entries_matching_word[entry['word']].append(entry)
+    With checkpoint_dir the entries are saved after loading and after each post-processing pass, and
+    resume_from (see checkpoints.RESUME_POINTS) starts from the latest valid checkpoint before that pass.
 
+    With search_vocabulary the result also has every word and form with its CDE frequency, for the
+    search index (see search_index.py)."""
+    try:
+      checkpoints = None
+      if checkpoint_dir:
+        # imported here so the default path doesn't pay for it
+        from checkpoints import Checkpoints
+        checkpoints = Checkpoints(checkpoint_dir, input_file)
+      if lemma_sources_cache is None and incremental_cache:
+        lemma_sources_cache = os.path.join(incremental_cache, "lemma_sources.snapshot")
+
+      # profiles and per-stage memory of overlapping stages would be mixed up
+      scheduler = Scheduler(concurrent=concurrent and not stats.profile, stats=stats)
       if not no_post_process:
+        # imported here since it needs this module's pos conversion tables
+        from lemma_sources import load_lemma_sources
+        scheduler.add("CDE/SRG load", partial(load_lemma_sources, cde_input, srg_input_dir, lemma_sources_cache), where="process")
+
+      if streaming:
+        # imported here so the default path doesn't pay for it
+        from streaming import process_entries_streaming
+        # passes run per bucket and in one sweep here, so they can't be timed separately
+        processed = "load and post-process (streaming)"
+        scheduler.add(processed, lambda: process_entries_streaming(
+          input_file, no_post_process, streaming_buckets, streaming_dir, workers, incremental_cache))
+      else:
+        # times the parse and the checkpoint after it separately, stats stages can't be nested
+        scheduler.add("load", lambda: load_or_resume(input_file, workers, stats, checkpoints, resume_from, incremental_cache),
+          timed=False)
+        processed = "post-process"
+        scheduler.add(processed, lambda loaded: (loaded[1], None if no_post_process else post_process(*loaded, stats, checkpoints)),
+          after=["load"], timed=False)
 
-        for word, entries in list(all_entries_matching_word.items()):
-          # we're going to iterate over the dictionary while we're modifying it, the details in this case are fine
-          if word.endswith("rse"):
-            non_reflexive_lemma = word[:-2]
-            qualifying_defins = [defin for defin in entries if is_defin_reflexive(defin)]
-            if not qualifying_defins:
-              continue
-
-            if len(qualifying_defins) == len(entries):
-              del all_entries_matching_word[word]
-            else:
-              for defin in qualifying_defins:
-                all_entries_matching_word[word].remove(defin)
-            
-            processed_qualifying_defins = [process_reflexive_defin(defin, non_reflexive_lemma) for defin in qualifying_defins]
-            if not all_entries_matching_word.get(non_reflexive_lemma) or all(defin.get("form_of") == word for defin in all_entries_matching_word.get(non_reflexive_lemma, [])):
-              all_entries_matching_word[non_reflexive_lemma] = processed_qualifying_defins
-            else:
-              for defin in all_entries_matching_word[non_reflexive_lemma]:
-                if defin.get("form_of") == word:
-                  all_entries_matching_word[non_reflexive_lemma].remove(defin)
-              all_entries_matching_word[non_reflexive_lemma].extend(processed_qualifying_defins)
-            
-            reflexive_verbs[word] = (non_reflexive_lemma, processed_qualifying_defins)
-        
-        for entries in all_entries_matching_word.values():
-          for defin in entries:
-            form_of = defin.get("form_of")
-            if form_of and form_of in reflexive_verbs:
-              defin["form_of"] = reflexive_verbs[form_of][0]
-        
-        # extract correct form from multi-token forms
-        for word, entries in all_entries_matching_word.items():
-          if len(word.split()) == 1:
-            for defin in entries:
-              forms = defin.get("forms")
-              if forms:
-                defin['forms'] = list(set(last_token for last_token in (form.split()[-1] for form in forms) if last_token not in EXCLUDED_MALFORMED_MULTI_TOKEN_FORMS_LAST_TOKEN))
-                # this works correctly in all but literally 18 cases, and these are all malformed entries anyway
-                if any(len(form.split()) > 1 for form in forms):
-                  defin["full_forms"] = list(set(forms))
-              else:
-                continue
-          else:
-            for defin in entries:
-                if defin.get("forms"):
-                    defin['forms'] = list(set(defin['forms']))
-            # for multi-token lemmas it's in principle possible to extract the "actual" lemma and all its forms, but nto worth it
-
-        for (word, entries) in list(all_entries_matching_word.items()):
-          for defin in entries:
-            insert_from_forms_entries(defin, all_entries_matching_word)
-        
-        print("finished extra processing on dictionary output")
-        
-        if generate_lemma_list:
-          for entries in all_entries_matching_word.values():
-            for entry in entries:
-              lemma_set.update(find_lemmas_from_form_of_defin(entry, all_entries_matching_word))
-          lemma_set.remove(None)
-        
-        # I'm lowercasing everything, this is slightly problematic but is a fine model for lemmatization at least for spanish
-        with open(cde_input, "r", encoding="windows-1252") as file:
-          for line in islice(file, 8, None):
-            entry = line.split()
-            rank, lemma_freq, lemma, pos, form_freq, form, _ = entry
-            (form, lemma) = (form.lower(), lemma.lower())
-            pos = davies_pos_conversion[pos]
-            forms_lemmas[form][pos][lemma] = int(form_freq)
-
-        for filename in [name for name in os.listdir(srg_input_dir) if name != "verbs-nogros"]:
-          with open(srg_input_dir + filename, "r", encoding="windows-1252") as file:
-            for line in file:
-              form, lemma, tag = line.split()
-              (form, lemma) = (form.lower(), lemma.lower())
-              if "+" in lemma:
-                lemma = lemma.split("+")[0]
-              pos = srg_pos_conversion[tag[0]]
-              if forms_lemmas[form][pos].get(lemma) is None:
-                forms_lemmas[form][pos][lemma] = 0
-              # srg doesn't have a line for the lemma pointing to itself
-              if forms_lemmas[lemma][pos].get(lemma) is None:
-                forms_lemmas[lemma][pos][lemma] = -1
-                # in this case I'm prioritizing srg after wiktionary. this is kind of a toss-up
-
-        if not no_wiktionary:
-          for word, entries in all_entries_matching_word.items():
-            for entry in entries:
-              word = word.lower()
-              lemmas = [lemma.lower() for lemma in find_lemmas_from_form_of_defin(entry, all_entries_matching_word) if lemma is not None]
-              pos = wiktionary_pos_conversion[entry.get("pos")]
-              for lemma in lemmas:
-                if forms_lemmas[word][pos].get(lemma) is None:
-                  forms_lemmas[word][pos][lemma] = 0
-        
-        for key, value in forms_lemmas.items():
-          new_value = {}
-          for pos, lemmas_dict in value.items():
-            new_value[pos] = sorted(lemmas_dict.items(), key=lambda item: -item[1])[0][0]
-          pos_lookup_table[key] = new_value
-        
+      if write_entries:
+        scheduler.add("write output", lambda processed: write_entries(processed[0]), after=[processed], where="thread")
 
+      if not no_post_process:
+        if generate_lemma_list:
+          scheduler.add("lemma list", lambda processed: lemma_list(processed[1], stats), after=[processed], where="thread")
+        scheduler.add("table reduction", lambda processed, lemma_sources: lemmatization_table_from(
+          lemma_sources, processed[1], no_wiktionary, stats), after=[processed, "CDE/SRG load"])
+        if search_vocabulary:
+          scheduler.add("search vocabulary", lambda processed, lemma_sources: vocabulary_frequencies(
+            processed[0], lemma_sources, stats), after=[processed, "CDE/SRG load"], where="thread")
+
+      results = scheduler.run()
       result = {
-          'entries': all_entries_matching_word,
+          'entries': results[processed][0],
       }
       
       if lemmatization_table:
-          result['pos_lookup_table'] = pos_lookup_table
+          result['pos_lookup_table'] = results.get("table reduction", {})
           
       if generate_lemma_list:
-          result['lemma_set'] = lemma_set
+          result['lemma_set'] = results.get("lemma list", set())
+
+      if search_vocabulary:
+          result['search_vocabulary'] = results.get("search vocabulary", {})
               
       return result
     except FileNotFoundError as e:
         print(f"FileNotFoundError: {e}")
         return None
+
+def post_process(passes_done, all_entries_matching_word, reflexive_verbs, stats=NO_STATS, checkpoints=None):
+  """Returns a function which yields the lemma contributions of the post-processed entries."""
+  lemma_index = post_process_entries(all_entries_matching_word, stats, checkpoints, passes_done, reflexive_verbs)
+  print("finished extra processing on dictionary output")
+  return lambda: lemma_contributions_by_word(all_entries_matching_word.items(), lemma_index)
+
+def lemma_list(lemma_contributions, stats=NO_STATS):
+  lemma_set = set()
+  for _, lemmas, _ in lemma_contributions():
+    for entry_lemmas in lemmas:
+      lemma_set.update(entry_lemmas)
+  # None stands for a form_of target which isn't in the dictionary, a small one may not have any
+  lemma_set.discard(None)
+  stats.count("lemmas", len(lemma_set))
+  return lemma_set
+
+def lemmatization_table_from(lemma_sources, lemma_contributions, no_wiktionary, stats=NO_STATS):
+  wiktionary_lemmas = () if no_wiktionary else wiktionary_lemmatizations(lemma_contributions())
+  pos_lookup_table = lemma_sources.lemmatization_table(wiktionary_lemmas)
+  stats.count("lemmatization table forms", len(pos_lookup_table))
+  return pos_lookup_table
+
+def wiktionary_lemmatizations(lemma_contributions):
+  for word, _, wiktionary_lemmas in lemma_contributions:
+    word = word.lower()
+    for pos, lemmas in wiktionary_lemmas:
+      for lemma in lemmas:
+        yield word, pos, lemma
+
+def vocabulary_frequencies(all_entries_matching_word, lemma_sources, stats=NO_STATS):
+  """{word or form: CDE frequency} for every word and every form of its entries, 0 if it's not in CDE."""
+  frequencies = lemma_sources.form_frequencies()
+  vocabulary = {}
+  # items() since with --streaming the entries can only be iterated in order
+  for word, entries in all_entries_matching_word.items():
+    vocabulary[word] = frequencies.get(word.lower(), 0)
+    for entry in entries:
+      for form in entry.get("forms") or ():
+        if form not in vocabulary:
+          vocabulary[form] = frequencies.get(form.lower(), 0)
+  stats.count("search vocabulary", len(vocabulary))
+  return vocabulary
+
+def load_or_resume(input_file, workers=1, stats=NO_STATS, checkpoints=None, resume_from=None, cache_dir=None):
+  """(passes done, all_entries_matching_word, the reflexive merge's result if it's done and the next
+  pass needs it), from a checkpoint when resuming."""
+  with stats.stage("load"):
+    resumed = checkpoints.resume(resume_from) if resume_from else None
+    if not resumed:
+      all_entries_matching_word = load_entries(input_file, workers, stats, cache_dir)
+  if resumed:
+    return resumed
+  if checkpoints:
+    with stats.stage("checkpoint after load"):
+      checkpoints.save("load", all_entries_matching_word)
+  return 0, all_entries_matching_word, None
+
+def load_entries(input_file, workers=1, stats=NO_STATS, cache_dir=None):
+  """With a cache_dir, parsed lines are cached there (see incremental.py)."""
+  # imported here, it imports this module
+  from incremental import open_parse_cache
+  parsed_entries = []
+
+  with open_parse_cache(cache_dir) as parse_cache:
+    for line_entries in parse_input_file(input_file, workers, parse_cache):
+      parsed_entries.extend(line_entries)
+  print("finished loading and parsing input file")
+
+  all_entries_matching_word = group_entries(parsed_entries)
+  if stats.enabled:
+    stats.count("words loaded", len(all_entries_matching_word))
+    stats.count("entries parsed", len(parsed_entries))
+  return all_entries_matching_word
+
+def group_entries(parsed_entries):
+  all_entries_matching_word = defaultdict(list)
+  for entry in parsed_entries:
+    all_entries_matching_word[entry['word']].append(entry)
+  return all_entries_matching_word
+
+PARSE_CHUNK_SIZE = 16 * 1024 * 1024
+
+def parse_input_file(input_file, workers=1, parse_cache=None):
+  """Yields the parsed entries for each line of the input file, in input order. With more than one
+  worker the file is read in large chunks of whole lines which are parsed in a process pool."""
+  if parse_cache is not None:
+    from incremental import parse_input_file_cached
+    yield from parse_input_file_cached(input_file, parse_cache, workers)
+    return
+  if workers <= 1:
+    with open_input(input_file, 'r') as infile:
+      for line in infile:
+        yield parse_entry(json_codec.loads(line))
+    return
+
+  with open_input(input_file, 'rb') as infile, parse_pool(workers) as pool:
+    # only keep a couple of chunks per worker in flight so memory doesn't grow with the input size
+    futures = (pool.submit(parse_chunk, chunk) for chunk in read_line_chunks(infile, PARSE_CHUNK_SIZE))
+    for future in run_ahead(futures, 2 * workers):
+      yield from future.result()
+
+def parse_pool(workers):
+  """Process pool to parse with. Parsing runs while the scheduler's threads and its CDE/SRG process'
+  management thread are running, and forking a process with other threads isn't safe (a lock one of
+  them holds stays locked in the child), so the workers are started from a fork server where there is
+  one. They're fresh processes then, so they're told which json codec to use."""
+  return ProcessPoolExecutor(workers, mp_context=forkserver_context(), initializer=json_codec.use, initargs=(json_codec.name,))
+
+def forkserver_context():
+  """The forkserver multiprocessing context, or the default one where there's no fork server."""
+  return multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None)
+
+def read_line_chunks(infile, chunk_size):
+  remainder = b""
+  while True:
+    chunk = infile.read(chunk_size)
+    if not chunk:
+      if remainder:
+        yield remainder
+      return
+    chunk = remainder + chunk
+    end = chunk.rfind(b"\n") + 1
+    if end:
+      remainder = chunk[end:]
+      yield chunk[:end]
+    else:
+      remainder = chunk
+
+def parse_chunk(chunk):
+  return parse_entries(json_codec.loads(line) for line in chunk.splitlines())
+
+POST_PROCESSING_PASSES = ["reflexive merge", "entry rewrite", "from_forms insertion"]
+
+def post_process_entries(all_entries_matching_word, stats=NO_STATS, checkpoints=None, passes_done=0, reflexive_verbs=None):
+  """Runs the post-processing passes in place, returns the FormOfLemmaIndex for the final entries.
+  With checkpoints the entries are saved after each pass. When resuming from a checkpoint, passes_done
+  skips the passes already done, and reflexive_verbs is the reflexive merge's result if the entry
+  rewrite still has to run.
+
+  The reflexive merge moves entries between words, so it has to be done before the rest. The entry
+  rewrite then only changes entries one at a time, and the from_forms insertion follows form_of chains
+  through the whole dictionary, so it needs every entry rewritten first."""
+  def checkpoint(name, extra=None):
+    if checkpoints:
+      with stats.stage(f"checkpoint after {name}"):
+        checkpoints.save(name, all_entries_matching_word, extra)
+
+  if passes_done < 1:
+    with stats.stage("reflexive merge"):
+      reflexive_verbs = merge_reflexive_entries(all_entries_matching_word)
+    stats.count("reflexive verbs merged", len(reflexive_verbs))
+    stats.count("reflexive definitions moved", sum(len(defins) for _, defins in reflexive_verbs.values()))
+    checkpoint("reflexive merge", reflexive_verbs)
+  forms_index = None
+  if passes_done < 2:
+    with stats.stage("entry rewrite"):
+      forms_index = rewrite_entries(all_entries_matching_word, reflexive_verbs)
+    # the forms index isn't saved, it's built again when resuming from here
+    checkpoint("entry rewrite")
+  if passes_done < 3:
+    with stats.stage("from_forms insertion"):
+      lemma_index = insert_all_from_forms_entries(all_entries_matching_word, forms_index)
+    checkpoint("from_forms insertion")
+  else:
+    # a new index resolves the same lemmas as the one kept up to date during the pass
+    lemma_index = FormOfLemmaIndex(all_entries_matching_word)
+
+  if stats.enabled:
+    defins = [defin for entries in all_entries_matching_word.values() for defin in entries]
+    stats.count("from_forms entries inserted", sum(1 for defin in defins if defin.get("from_forms")))
+    stats.count("dangling form_of targets", len({defin['form_of'] for defin in defins
+      if defin.get("form_of") and defin['form_of'] not in all_entries_matching_word}))
+  return lemma_index
+
+# the reflexive rules are specific to spanish, see languages.py
+MERGE_REFLEXIVE_VERBS = True
+
+def merge_reflexive_entries(all_entries_matching_word):
+  reflexive_verbs = {}
+  if not MERGE_REFLEXIVE_VERBS:
+    return reflexive_verbs
+  # merging a -rse word only changes its own entries and those of its non-reflexive lemma, which doesn't
+  # end in -rse, so the words to merge and their entries are the same as before any of them was merged
+  for word in [word for word in all_entries_matching_word if word.endswith("rse")]:
+    entries = all_entries_matching_word[word]
+    qualifying_defins = []
+    other_defins = []
+    for defin in entries:
+      (qualifying_defins if is_defin_reflexive(defin) else other_defins).append(defin)
+    if not qualifying_defins:
+      continue
+    non_reflexive_lemma = word[:-2]
+
+    if not other_defins:
+      del all_entries_matching_word[word]
+    else:
+      # the same as removing each qualifying entry, since any entry equal to one of them qualifies too
+      entries[:] = other_defins
+
+    processed_qualifying_defins = [process_reflexive_defin(defin, non_reflexive_lemma) for defin in qualifying_defins]
+    lemma_entries = all_entries_matching_word.get(non_reflexive_lemma)
+    form_of_word = [i for i, defin in enumerate(lemma_entries or ()) if defin.get("form_of") == word]
+    if not lemma_entries or len(form_of_word) == len(lemma_entries):
+      all_entries_matching_word[non_reflexive_lemma] = processed_qualifying_defins
+    else:
+      remove_form_of_entries(lemma_entries, word, form_of_word)
+      lemma_entries.extend(processed_qualifying_defins)
+
+    reflexive_verbs[word] = (non_reflexive_lemma, processed_qualifying_defins)
+  return reflexive_verbs
+
+def remove_form_of_entries(entries, word, form_of_word):
+  """Removes the entries which are a form of word, at the indexes form_of_word, the way removing them
+  while iterating over entries always did: the entry after a removed one isn't looked at, and remove
+  takes the first equal entry. With a single one that's just deleting it."""
+  if not form_of_word:
+    return
+  if len(form_of_word) == 1:
+    del entries[form_of_word[0]]
+    return
+  for defin in entries:
+    if defin.get("form_of") == word:
+      entries.remove(defin)
+
+def rewrite_entries(all_entries_matching_word, reflexive_verbs):
+  """Rewrites form_of of the merged reflexive verbs to their non-reflexive lemmas, and extracts the
+  correct form from multi-token forms, in one sweep since both only look at the entry itself. Returns
+  the FormsIndex of the rewritten entries for the from_forms insertion, built along the way.
+
+  reflexive_verbs is the reflexive merge's result, or any collection of the verbs it merged."""
+  forms_index = FormsIndex()
+  for word, entries in all_entries_matching_word.items():
+    single_token = len(word.split()) == 1
+    # entries parsed from the same line still share their forms list, and get the same result
+    shared_forms = rewritten_forms = full_forms = None
+    for defin in entries:
+      form_of = defin.get("form_of")
+      if form_of and form_of in reflexive_verbs:
+        # the non-reflexive lemma merge_reflexive_entries merged it into
+        defin["form_of"] = form_of[:-2]
+
+      forms = defin.get("forms")
+      if not forms:
+        continue
+      if forms is not shared_forms:
+        shared_forms = forms
+        rewritten_forms, full_forms = extract_multi_token_forms(forms, single_token)
+      defin['forms'] = rewritten_forms
+      if full_forms:
+        defin["full_forms"] = full_forms
+      forms_index.entry_added(word, defin)
+  return forms_index
+
+def extract_multi_token_forms(forms, single_token):
+  """(forms, full_forms or None) for an entry's forms. Forms become tuples here."""
+  if not single_token:
+    # for multi-token lemmas it's in principle possible to extract the "actual" lemma and all its forms, but nto worth it
+    return tuple(set(forms)), None
+  # extract correct form from multi-token forms, the last tokens are interned since most of them are words too
+  tokens = [form.split() for form in forms]
+  rewritten_forms = tuple(set(sys.intern(form_tokens[-1]) for form_tokens in tokens if form_tokens[-1] not in EXCLUDED_MALFORMED_MULTI_TOKEN_FORMS_LAST_TOKEN))
+  # this works correctly in all but literally 18 cases, and these are all malformed entries anyway
+  if any(len(form_tokens) > 1 for form_tokens in tokens):
+    return rewritten_forms, tuple(set(forms))
+  return rewritten_forms, None
+
+def insert_all_from_forms_entries(all_entries_matching_word, forms_index=None):
+  # the form_of graph doesn't change before this pass, and this pass keeps the indexes up to date
+  lemma_index = FormOfLemmaIndex(all_entries_matching_word)
+  if forms_index is None:
+    forms_index = FormsIndex(all_entries_matching_word)
+  for (word, entries) in list(all_entries_matching_word.items()):
+    for defin in entries:
+      insert_from_forms_entries(defin, all_entries_matching_word, lemma_index, forms_index)
+  return lemma_index
+
+def lemma_contributions_by_word(word_entries, lemma_index):
+  """Yields, for each word in order, what it adds to the lemma list and to the wiktionary part of the
+  lemmatization table. The wiktionary lemmas are kept as lists since their order breaks ties in the table."""
+  for word, entries in word_entries:
+    lemmas = []
+    wiktionary_lemmas = []
+    for entry in entries:
+      entry_lemmas = lemma_index.lemmas(entry)
+      lemmas.append(entry_lemmas)
+      wiktionary_lemmas.append((wiktionary_pos_conversion[entry.get("pos")], [lemma.lower() for lemma in entry_lemmas if lemma is not None]))
+    yield word, lemmas, wiktionary_lemmas
     
 EXCLUDED_MALFORMED_MULTI_TOKEN_FORMS_LAST_TOKEN = {"gender-neutral", "meaning"}
 
@@ -224,16 +459,17 @@ def group_senses(entry):
   return list(groups.values())
 
 FAILED_FORM_OF_PROBLEMATIC_CONJUGATIONS = ['infinitive', 'gerund', 'preterite', 'imperfect', 'indicative']
+FAILED_FORM_OF_CONJUGATION_PATTERNS = [(conj, re.compile(r"\b" + re.escape(conj) + r"\b\s+(\w+)"))
+  for conj in FAILED_FORM_OF_PROBLEMATIC_CONJUGATIONS]
 
 def extract_form_of(gloss):
   first_pass_lemma = gloss.split(" of ")[-1]
-  if len(first_pass_lemma.split(" ")) == 1:
+  if " " not in first_pass_lemma:
     return first_pass_lemma
   else:
-    for conj in FAILED_FORM_OF_PROBLEMATIC_CONJUGATIONS:
+    for conj, pattern in FAILED_FORM_OF_CONJUGATION_PATTERNS:
       if conj in first_pass_lemma:
-        pattern = r"\b" + re.escape(conj) + r"\b\s+(\w+)"
-        match = re.search(pattern, first_pass_lemma)
+        match = pattern.search(first_pass_lemma)
         if match:
             return match.group(1)
     return first_pass_lemma.split(",")[0]
@@ -272,17 +508,22 @@ def is_failed_form_of(entry):
     ])
 )
 
+GLOSS_PATTERN = re.compile(r'(?:\(([^)]*)\))?(.*?)\s*(?:\(([^)]*)\))?$')
+
 def rip_defin_label_gloss(orig_gloss, extra_labels):
   if orig_gloss == None:
     return {"definition": None}
 
-  pattern = r'(?:\(([^)]*)\))?(.*?)\s*(?:\(([^)]*)\))?$'
-
-  match = re.match(pattern, orig_gloss)
-  if not match:
-    raise Exception("invalid gloss, failed regex")
+  if "(" not in orig_gloss and "\n" not in orig_gloss:
+    # most glosses have no label or gloss in parentheses, and for those GLOSS_PATTERN only strips
+    # trailing whitespace (. doesn't match newlines, those are left to the regex)
+    label, definition, gloss = None, orig_gloss.rstrip(), None
+  else:
+    match = GLOSS_PATTERN.match(orig_gloss)
+    if not match:
+      raise Exception("invalid gloss, failed regex")
 
-  label, definition, gloss = match.groups()
+    label, definition, gloss = match.groups()
 
   extra_tag_label = ", ".join([tag for tag in extra_labels if tag not in orig_gloss])
   if extra_tag_label:
@@ -297,12 +538,13 @@ def clean_glosses(senses):
   definitions = []
   for sense in senses:
     if len(sense.get('raw_glosses', [])) == 1:
-      definitions.append((sense['raw_glosses'][0], tags_for_defin(sense)))
+      orig_gloss = sense['raw_glosses'][0]
     elif sense.get("glosses"):
-      definitions.append((", ".join([remove_ending_colon(gloss) for gloss in sense['glosses']]), tags_for_defin(sense)))
+      orig_gloss = ", ".join([remove_ending_colon(gloss) for gloss in sense['glosses']])
     else:
-      definitions.append((None, tags_for_defin(sense)))
-  return [rip_defin_label_gloss(*defin) for defin in definitions]
+      orig_gloss = None
+    definitions.append(Definition(rip_defin_label_gloss(orig_gloss, tags_for_defin(sense))))
+  return tuple(definitions)
 
 def remove_ending_colon(s):
   if s.endswith(":"):
@@ -312,7 +554,7 @@ def remove_ending_colon(s):
 def parse_multiple_form_of(group):
   # in 99.86% of cases for spanish we're dealing with an nice nested inflected form intersection, which all have `glosses` len 2. for the rest we do this:
   if any([len(sense['glosses']) != 2 for sense in group]):
-    return [{"definition": sense['glosses'][0]} for sense in group]
+    return tuple(Definition({"definition": sense['glosses'][0]}) for sense in group)
   else:
     lemma_string = remove_ending_colon(group[0]['glosses'][0].split("\n")[0].split(" of ")[1].strip())
     result = []
@@ -322,8 +564,8 @@ def parse_multiple_form_of(group):
       if not definition.endswith(lemma_string):
         definition += " of " + lemma_string
 
-      result.append({"definition": definition})
-    return result
+      result.append(Definition({"definition": definition}))
+    return tuple(result)
 
 def parse_sense_group(group, entry):
   parsed = {}
@@ -391,7 +633,11 @@ def parse_entry(entry):
     main_props['forms'] = extract_inflected_forms(entry['forms'], entry['word'])
 
   sense_groups = group_senses(entry)
-  return [{**main_props, **parse_sense_group(group, entry)} for group in sense_groups]
+  return [Entry({**main_props, **parse_sense_group(group, entry)}) for group in sense_groups]
+
+def parse_entries(entries):
+  """parse_entry for a batch of entries, eg. a chunk of input lines."""
+  return [parse_entry(entry) for entry in entries]
 
 def get_gender_by_sense(sense):
   result = []
@@ -403,56 +649,35 @@ def get_gender_by_sense(sense):
     result.append("f")
   return result
 
-def find_lemmas_from_form_of_defin(defin, entries, forms_set=None, pos=None, first_call=True):
-  pos = pos if pos else defin['pos']
-  forms_set = forms_set if forms_set else set()
-  form = defin.get("form_of")
-
-  if form in forms_set:
-    return {form}
-  elif defin['pos'] != pos:
-    return {}
-  elif not form:
-    return {defin['word']}
-  elif form not in entries:
-    return {None}
-  else:
-
-    forms_set.add(form)
-
-    child_lemmas = {lemma
-      for form_defin in entries.get(form)
-        for lemma in find_lemmas_from_form_of_defin(form_defin, entries, forms_set, pos, False)}
-
-    if first_call:
-      child_lemmas = {lemma for lemma in child_lemmas if lemma != defin['word']}
-      return child_lemmas if child_lemmas else {None}
-    else:
-      return child_lemmas if child_lemmas else {None}
-
-def insert_from_forms_entries(defin, entries):
-  if defin.get("forms"):
-    for form in defin.get("forms"):
-      if form == defin['word']:
-        pass
-      elif defin.get("form_of") and any(
-          any(
-            lemma_defin.get("pos") == defin.get("pos") and
-            form in lemma_defin.get("forms", [])
-            for lemma_defin in entries.get(lemma, [])
-          )
-          for lemma in find_lemmas_from_form_of_defin(defin, entries)
-        ):
-        pass
-      else:
-        if not any(
-            form_defin.get("pos") == defin.get("pos") and 
-            # this is somewhat naive, there can be more edges in the form_of graph that will lead to duplicate from_forms entries here. eg 'disfamada'
-            (defin['word'] in find_lemmas_from_form_of_defin(form_defin, entries) or 
-            defin['word'] == form_defin.get('form_of') or
-            defin['word'] in form_defin.get("forms", [])
-            )
-          for form_defin in entries.get(form, [])):
-          new_form_of = {"word": form, "pos": defin['pos'], "f_pos": wiktionary_pos_conversion[defin.get("pos")], "from_forms": True, "form_of": defin['word'], "definitions": []}
-          entries[form].append(new_form_of)
+def find_lemmas_from_form_of_defin(defin, entries):
+  # one-off lookup, the post-processing passes share a FormOfLemmaIndex instead
+  return FormOfLemmaIndex(entries).lemmas(defin)
 
+def insert_from_forms_entries(defin, entries, lemma_index, forms_index):
+  forms = defin.get("forms")
+  if not forms:
+    return
+  word, pos, form_of = defin['word'], defin.get("pos"), defin.get("form_of")
+  # defin's own lemmas, only looked up again after an insertion, which can change them
+  lemmas = None
+  for form in forms:
+    if form == word:
+      continue
+    if form_of:
+      if lemmas is None:
+        lemmas = lemma_index.lemmas(defin)
+      if any(form in forms_index.forms(lemma, pos) for lemma in lemmas):
+        continue
+    # the forms index is checked first since it's the cheapest of the three
+    if not (word in forms_index.forms(form, pos) or any(
+        form_defin.get("pos") == pos and
+        # this is somewhat naive, there can be more edges in the form_of graph that will lead to duplicate from_forms entries here. eg 'disfamada'
+        (word == form_defin.get('form_of') or
+        word in lemma_index.lemmas(form_defin)
+        )
+      for form_defin in entries.get(form, []))):
+      new_form_of = Entry({"word": form, "pos": defin['pos'], "f_pos": wiktionary_pos_conversion[pos], "from_forms": True, "form_of": word, "definitions": ()})
+      entries[form].append(new_form_of)
+      lemma_index.entry_added(form)
+      forms_index.entry_added(form, new_form_of)
+      lemmas = None
@@ -0,0 +1,123 @@
+"""A small scheduler for the stages of process_dictionary_data.
+
+Stages are added with the stages they depend on, and are called with those stages' results. Each stage
+starts as soon as its dependencies have finished: "main" stages run in the calling thread, in the order
+they were added, "thread" stages in a thread pool, and "process" stages in a process pool (so their
+function, arguments and result have to be picklable, and they can't see changes made after the pool
+started). A stage's result only depends on its dependencies' results, never on timing, so the results
+are the same as running the stages one after another, which is what happens with concurrent=False.
+
+Stages are timed as stats stages of the same name, except those added with timed=False (eg. because
+they time their own steps). A process stage is timed from this process, from when it's submitted.
+
+run_ahead is for the stages' own process pools, which work through a stream of chunks in order.
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from stats import NO_STATS
+
+WHERE = ["main", "thread", "process"]
+
+
+def run_ahead(tasks, in_flight):
+  """Yields the items of tasks in order, each one once in_flight - 1 more have been taken from tasks.
+  tasks starts the work as it's iterated, eg. a generator submitting to a pool, so a few chunks per
+  worker are always in flight without all the results piling up in memory."""
+  pending = deque()
+  for task in tasks:
+    pending.append(task)
+    if len(pending) >= in_flight:
+      yield pending.popleft()
+  while pending:
+    yield pending.popleft()
+
+
+class Stage:
+  def __init__(self, name, function, after, where, timed):
+    self.name = name
+    self.function = function
+    self.after = after
+    self.where = where
+    self.timed = timed
+
+
+class Scheduler:
+  def __init__(self, concurrent=True, threads=4, stats=NO_STATS):
+    self.concurrent = concurrent
+    self.threads = threads
+    self.stats = stats
+    self.stages = {}
+
+  def add(self, name, function, after=(), where="main", timed=True):
+    if name in self.stages:
+      raise Exception(f"stage {name} was already added")
+    if where not in WHERE:
+      raise Exception(f"stage {name} can't run in {where}, only in one of {', '.join(WHERE)}")
+    for dependency in after:
+      if dependency not in self.stages:
+        raise Exception(f"stage {name} depends on {dependency}, which has to be added first")
+    self.stages[name] = Stage(name, function, tuple(after), where, timed)
+
+  def call(self, stage, args, processes=None):
+    if not stage.timed:
+      return stage.function(*args)
+    with self.stats.stage(stage.name):
+      if processes:
+        return processes.submit(stage.function, *args).result()
+      return stage.function(*args)
+
+  def run(self):
+    """Runs every stage, returns {name: result}. The first exception raised by a stage is raised here."""
+    if not self.concurrent:
+      results = {}
+      # stages can only depend on stages added before them, so this order is always fine
+      for stage in self.stages.values():
+        results[stage.name] = self.call(stage, [results[dependency] for dependency in stage.after])
+      return results
+
+    threads = ThreadPoolExecutor(self.threads)
+    processes = None
+    try:
+      if any(stage.where == "process" for stage in self.stages.values()):
+        processes = ProcessPoolExecutor(1)
+        # forks the worker now, before this process has started any threads or grown
+        processes.submit(int).result()
+      return self._run(threads, processes)
+    finally:
+      threads.shutdown(wait=False, cancel_futures=True)
+      if processes:
+        # waits for a stage still running after another one failed, exiting without waiting for the
+        # worker can fail in the executor's exit handler
+        processes.shutdown(cancel_futures=True)
+
+  def _run(self, threads, processes):
+    results = {}
+    running = {}
+    waiting = list(self.stages.values())
+    while waiting or running:
+      ready = [stage for stage in waiting if all(dependency in results for dependency in stage.after)]
+      for stage in ready:
+        if stage.where == "main":
+          continue
+        waiting.remove(stage)
+        args = [results[dependency] for dependency in stage.after]
+        # a process stage waits for its result in a thread, where it's timed
+        running[threads.submit(self.call, stage, args, processes if stage.where == "process" else None)] = stage
+
+      main_stage = next((stage for stage in ready if stage.where == "main"), None)
+      if main_stage:
+        waiting.remove(main_stage)
+        results[main_stage.name] = self.call(main_stage, [results[dependency] for dependency in main_stage.after])
+      elif running:
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+          results[running.pop(future).name] = future.result()
+      elif waiting:
+        raise Exception(f"stages {', '.join(stage.name for stage in waiting)} can't be run")
+
+      # collect whatever else finished meanwhile, so stages waiting on it can start
+      for future in [future for future in running if future.done()]:
+        results[running.pop(future).name] = future.result()
+    return results
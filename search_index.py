@@ -0,0 +1,223 @@
+"""Binary search index over every word and form of the dictionary, for autocompletion and for finding
+words typed without their accents or with a typo, without scanning the whole vocabulary.
+
+Everything is looked up by its folded key: lowercased and without accents or other diacritics, so
+"cancion" finds "canción" (and "ano" finds "año"). Words and forms are sorted by their folded key,
+so the ones starting with a prefix are a range of the index, and the most frequent ones in a range are
+found with a max tree over their CDE frequencies instead of looking at the whole range. Fuzzy matches
+are found by looking up every key within one edit of the query in a hash table.
+
+  with SearchIndex("search.idx") as index:
+    index.prefix("cancio")  # [("canción", 1893), ("canciones", 1102), ...], most frequent first
+    index.fuzzy("cancoin")  # within one edit of the folded query, closest and then most frequent first
+    index.search("cancion")  # prefix matches, then fuzzy ones if there are fewer than limit
+
+Layout, like the lemmatization index (see mmap_index.py) all arrays are of uint32 in the byte order
+recorded in the header, and the file is used straight from an mmap:
+
+  header          MAGIC, byte order, then key, record, slot, tree and alphabet sizes (little endian)
+  key offsets     n_keys + 1 offsets into the key pool
+  key records     n_keys + 1 offsets into the records, one range per key
+  string offsets  n_records + 1 offsets into the string pool
+  frequencies     CDE frequency of each record
+  tree            for every node of a binary tree over the records, padded to a power of two, the
+                  record with the highest frequency below it (the first one on ties), or EMPTY
+  slots           open addressing hash table on the crc32 of the key, index in keys + 1 or 0 if empty
+  key pool        every distinct folded key, UTF-8, sorted, not separated
+  string pool     the word or form of every record, UTF-8, in the order of their keys and then their bytes
+  alphabet        the characters used for fuzzy lookups, UTF-8
+"""
+
+import heapq
+import unicodedata
+from array import array
+from collections import Counter
+
+from mmap_index import MappedIndex, find_slot, hash_slots, header_struct, write_header
+
+MAGIC = b"SRCHIDX1"
+HEADER = header_struct(5)
+EMPTY = 0xFFFFFFFF
+# characters in fewer keys than this are left out of the alphabet fuzzy lookups insert and substitute
+ALPHABET_MIN_SHARE = 1 / 10000
+
+
+def fold(string):
+  """The key string is looked up by, lowercased and without combining marks: canción -> cancion."""
+  string = string.lower()
+  if string.isascii():
+    return string
+  return "".join(c for c in unicodedata.normalize("NFD", string) if not unicodedata.combining(c))
+
+
+def write_search_index(path, vocabulary):
+  """Writes {word or form: frequency} as a search index to path."""
+  records = sorted((fold(string).encode(), string.encode(), frequency) for string, frequency in vocabulary.items())
+
+  key_offsets, key_records, key_pool = array('I', [0]), array('I', [0]), []
+  string_offsets, frequencies = array('I', [0]), array('I')
+  for i, (key, string, frequency) in enumerate(records):
+    if not key_pool or key != key_pool[-1]:
+      if key_pool:
+        key_records.append(i)
+      key_pool.append(key)
+      key_offsets.append(key_offsets[-1] + len(key))
+    string_offsets.append(string_offsets[-1] + len(string))
+    frequencies.append(frequency)
+  if key_pool:
+    key_records.append(len(records))
+
+  # node i has children 2i and 2i + 1, leaves are size + record index and aren't stored
+  size = 1
+  while size < len(records):
+    size *= 2
+  tree = array('I', [EMPTY]) * (2 * size)
+  for i in range(len(records)):
+    tree[size + i] = i
+  for node in range(size - 1, 0, -1):
+    left, right = tree[2 * node], tree[2 * node + 1]
+    if right == EMPTY or (left != EMPTY and frequencies[left] >= frequencies[right]):
+      tree[node] = left
+    else:
+      tree[node] = right
+  del tree[size:]
+
+  slots = hash_slots(key_pool)
+
+  characters = Counter(c for key in key_pool for c in set(key.decode()))
+  alphabet = "".join(c for c, n in characters.most_common() if n >= len(key_pool) * ALPHABET_MIN_SHARE).encode()
+
+  with open(path, 'wb') as file:
+    write_header(file, HEADER, MAGIC, len(key_pool), len(records), len(slots), size, len(alphabet))
+    for section in (key_offsets, key_records, string_offsets, frequencies, tree, slots):
+      section.tofile(file)
+    file.write(b"".join(key_pool))
+    file.write(b"".join(string for _, string, _ in records))
+    file.write(alphabet)
+
+
+class SearchIndex(MappedIndex):
+  """Prefix and fuzzy lookups in a search index written by write_search_index.
+
+  Like the Lemmatizer, opening only maps the file. Results are lists of (word or form, frequency)."""
+
+  def __init__(self, path):
+    n_keys, n_records, n_slots, size, alphabet_size = self._map(path, MAGIC, HEADER, "search index")
+    self._key_offsets = self._section(n_keys + 1)
+    self._key_records = self._section(n_keys + 1)
+    self._string_offsets = self._section(n_records + 1)
+    self._frequencies = self._section(n_records)
+    self._tree = self._section(size)
+    self._slots = self._section(n_slots)
+    self._size = size
+    self._key_pool = self._offset
+    self._string_pool = self._key_pool + self._key_offsets[n_keys]
+    alphabet_offset = self._string_pool + self._string_offsets[n_records]
+    self.alphabet = str(self._mmap[alphabet_offset:alphabet_offset + alphabet_size], 'utf-8')
+
+  def __len__(self):
+    return len(self._frequencies)
+
+  def _key(self, i):
+    return self._mmap[self._key_pool + self._key_offsets[i]:self._key_pool + self._key_offsets[i + 1]]
+
+  def _record(self, i):
+    string = self._mmap[self._string_pool + self._string_offsets[i]:self._string_pool + self._string_offsets[i + 1]]
+    return str(string, 'utf-8'), self._frequencies[i]
+
+  def _lower_bound(self, key):
+    """Index of the first key which isn't smaller than key."""
+    low, high = 0, len(self._key_offsets) - 1
+    while low < high:
+      middle = (low + high) // 2
+      if self._key(middle) < key:
+        low = middle + 1
+      else:
+        high = middle
+    return low
+
+  def _find(self, key):
+    """Index of key in the keys, or -1."""
+    return find_slot(self._slots, key, self._key)
+
+  def _heap_item(self, node):
+    best = node - self._size if node >= self._size else self._tree[node]
+    return -self._frequencies[best], best, node
+
+  def _most_frequent(self, start, end, limit):
+    """Indexes of the limit most frequent records in start:end, most frequent first."""
+    # the nodes which exactly cover start:end, then always expand the one with the best record left
+    # (none of them or their children are past the last record, so none are EMPTY)
+    nodes = []
+    low, high = start + self._size, end + self._size
+    while low < high:
+      if low & 1:
+        nodes.append(low)
+        low += 1
+      if high & 1:
+        high -= 1
+        nodes.append(high)
+      low //= 2
+      high //= 2
+    heap = [self._heap_item(node) for node in nodes]
+    heapq.heapify(heap)
+
+    result = []
+    while heap and len(result) < limit:
+      _, best, node = heapq.heappop(heap)
+      if node >= self._size:
+        result.append(best)
+      else:
+        heapq.heappush(heap, self._heap_item(2 * node))
+        heapq.heappush(heap, self._heap_item(2 * node + 1))
+    return result
+
+  def prefix(self, query, limit=10):
+    """The limit most frequent words and forms whose folded key starts with the folded query."""
+    key = fold(query).encode()
+    # no UTF-8 byte is 0xff, so every key starting with key sorts before key + b"\xff"
+    start, end = self._lower_bound(key), self._lower_bound(key + b"\xff")
+    records = self._most_frequent(self._key_records[start], self._key_records[end], limit)
+    return [self._record(i) for i in records]
+
+  def _edits(self, key):
+    """Every string one deletion, transposition, substitution or insertion away from key."""
+    splits = [(key[:i], key[i:]) for i in range(len(key) + 1)]
+    edits = set()
+    for left, right in splits:
+      if right:
+        edits.add(left + right[1:])
+        if len(right) > 1:
+          edits.add(left + right[1] + right[0] + right[2:])
+        for c in self.alphabet:
+          edits.add(left + c + right[1:])
+      for c in self.alphabet:
+        edits.add(left + c + right)
+    edits.discard(key)
+    return edits
+
+  def fuzzy(self, query, limit=10, max_distance=1):
+    """The words and forms whose folded key is within max_distance (0 or 1) edits of the folded query,
+    those with fewer edits first and then the most frequent. With 0 only accents and case differ."""
+    if max_distance not in (0, 1):
+      raise Exception("fuzzy lookups only go up to one edit")
+    key = fold(query)
+    candidates = [(0, key)]
+    if max_distance:
+      candidates += [(1, edit) for edit in self._edits(key)]
+    found = []
+    for distance, candidate in candidates:
+      i = self._find(candidate.encode())
+      if i >= 0:
+        for record in range(self._key_records[i], self._key_records[i + 1]):
+          found.append((distance, -self._frequencies[record], record))
+    return [self._record(record) for _, _, record in sorted(found)[:limit]]
+
+  def search(self, query, limit=10):
+    """What autocompletion shows: prefix matches, followed by fuzzy matches which aren't prefix matches
+    if there are fewer than limit of those."""
+    results = self.prefix(query, limit)
+    if len(results) < limit:
+      seen = set(results)
+      results += [result for result in self.fuzzy(query, limit) if result not in seen][:limit - len(results)]
+    return results
@@ -0,0 +1,159 @@
+"""Per-stage measurements for --stats: wall time, memory and counters, written as a JSON report.
+
+Every stage records its wall time, the peak RSS while it ran (or the process peak so far where the
+peak can't be reset), the change in RSS and in the number of allocated Python objects. With
+--profile=cprofile each stage is also profiled and dumped for pstats, with --profile=tracemalloc the
+allocations of each stage are traced and dumped as a tracemalloc snapshot, and the top allocation
+sites are included in the report.
+"""
+
+import cProfile
+import json
+import os
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+PROFILERS = ["cprofile", "tracemalloc"]
+
+
+def current_rss_bytes():
+  try:
+    with open("/proc/self/statm") as statm:
+      return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+  except (OSError, ValueError):
+    return None
+
+
+def peak_rss_bytes():
+  try:
+    with open("/proc/self/status") as status:
+      for line in status:
+        if line.startswith("VmHWM:"):
+          return int(line.split()[1]) * 1024
+  except OSError:
+    pass
+  # kilobytes on linux, bytes on macos
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def reset_peak_rss():
+  # linux only, resets VmHWM to the current RSS
+  try:
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+      clear_refs.write("5")
+    return True
+  except OSError:
+    return False
+
+
+def mib(size):
+  return None if size is None else round(size / 1024 / 1024, 2)
+
+
+class Stats:
+  """Collects stages and counters. A disabled Stats measures nothing, so code can always call it."""
+
+  def __init__(self, enabled=True, profile=None, profile_prefix=None):
+    self.enabled = enabled
+    self.profile = profile
+    self.profile_prefix = profile_prefix
+    self.stages = []
+    self.counters = {}
+    self.start = time.perf_counter()
+    # the peak is reset for every stage, so the overall peak is kept here
+    self.peak_rss = 0
+    # stages can overlap when they're run by a Scheduler
+    self.lock = threading.Lock()
+    self.active = 0
+    self.started = 0
+
+  @contextmanager
+  def stage(self, name):
+    if not self.enabled:
+      yield
+      return
+    with self.lock:
+      self.peak_rss = max(self.peak_rss, peak_rss_bytes())
+      # resetting the peak while another stage runs would lose that stage's peak
+      peak_is_per_stage = not self.active and reset_peak_rss()
+      self.active += 1
+      self.started += 1
+      started = self.started
+    rss_before, blocks_before = current_rss_bytes(), sys.getallocatedblocks()
+    profiler = None
+    if self.profile == "cprofile":
+      profiler = cProfile.Profile()
+      profiler.enable()
+    elif self.profile == "tracemalloc":
+      tracemalloc.start()
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      seconds = time.perf_counter() - start
+      if profiler:
+        profiler.disable()
+      rss_after, peak_rss = current_rss_bytes(), peak_rss_bytes()
+      with self.lock:
+        self.peak_rss = max(self.peak_rss, peak_rss)
+        # the peak includes any stage which started meanwhile
+        peak_is_per_stage = peak_is_per_stage and self.started == started
+        self.active -= 1
+      stage = {
+        "name": name,
+        "seconds": round(seconds, 4),
+        "peak_rss_mib": mib(peak_rss),
+        "peak_rss_is_per_stage": peak_is_per_stage,
+        "rss_delta_mib": mib(rss_after - rss_before) if rss_after is not None and rss_before is not None else None,
+        "allocated_blocks_delta": sys.getallocatedblocks() - blocks_before,
+      }
+      if profiler:
+        path = self.profile_path(name, "prof")
+        profiler.dump_stats(path)
+        stage["profile"] = path
+      elif self.profile == "tracemalloc":
+        stage.update(self.tracemalloc_stats(name))
+        tracemalloc.stop()
+      self.stages.append(stage)
+
+  def tracemalloc_stats(self, name):
+    traced, traced_peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    path = self.profile_path(name, "tracemalloc")
+    snapshot.dump(path)
+    top = snapshot.statistics("lineno")[:10]
+    return {
+      "traced_mib": mib(traced),
+      "traced_peak_mib": mib(traced_peak),
+      "profile": path,
+      "top_allocations": [{"where": str(stat.traceback), "mib": mib(stat.size), "count": stat.count} for stat in top],
+    }
+
+  def profile_path(self, name, extension):
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+    return f"{self.profile_prefix}.{len(self.stages) + 1:02}-{slug}.{extension}"
+
+  def count(self, name, n=1):
+    if self.enabled:
+      self.counters[name] = self.counters.get(name, 0) + n
+
+  def report(self):
+    return {
+      "total_seconds": round(time.perf_counter() - self.start, 4),
+      "peak_rss_mib": mib(max(self.peak_rss, peak_rss_bytes())),
+      "profile": self.profile,
+      "stages": self.stages,
+      "counters": self.counters,
+    }
+
+  def write(self, path):
+    with open(path, "w") as outfile:
+      json.dump(self.report(), outfile, indent=2)
+
+
+NO_STATS = Stats(enabled=False)
@@ -0,0 +1,281 @@
+"""Bounded-memory version of the load and post-processing steps of process_dictionary_data.
+
+The parsed entries are spilled to disk, hashed into buckets by neighbourhood: a word, together with
+its -rse verb if it has one. The reflexive merge and the entry rewrite only ever look at a
+neighbourhood (the form_of rewrite also needs to know which verbs get merged, but that only depends on
+their own entries, so it's known after loading), so they run one bucket at a time with the same
+functions the in-memory path uses, and the rewritten entries are spilled again in sorted runs. Only one
+bucket of entries is held in memory at a time.
+
+The from_forms insertion follows form_of chains and forms through the whole dictionary, so it then
+sweeps over the rewritten entries of all the words, in order. It only needs the word, pos and form_of
+of every entry, which are held in memory as FormOfLinks, and the forms of the words it looks at, which
+are in an OnDiskFormsIndex. The entries it inserts are kept in memory and added to the output.
+
+Output order is reconstructed from the position each word would have had in all_entries_matching_word,
+so the result is the same as the in-memory path.
+"""
+
+import functools
+import heapq
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import weakref
+import zlib
+from collections import Counter, defaultdict
+from itertools import islice
+
+import process_dictionary
+from process_dictionary import (
+  merge_reflexive_entries,
+  rewrite_entries,
+  insert_from_forms_entries,
+  is_defin_reflexive,
+  lemma_contributions_by_word,
+  parse_input_file,
+)
+from indexes import FormOfLemmaIndex, FormsIndex
+import incremental
+
+# how many (word, pos) forms sets the OnDiskFormsIndex keeps, the from_forms insertion looks up the
+# forms of the same lemma for each of a word's forms
+FORMS_CACHE_SIZE = 4096
+
+
+def process_entries_streaming(input_file, no_post_process, n_buckets=64, spill_dir=None, workers=1, cache_dir=None):
+  """Returns (entries, lemma_contributions) like the in-memory path, but `entries` is a StreamedEntries
+  which only supports iterating over items() in order.
+
+  With a cache_dir, parsed lines are cached there (see incremental.py)."""
+  tmpdir = tempfile.mkdtemp(prefix="wiktextract-cleanup-", dir=spill_dir)
+  entries = StreamedEntries(tmpdir)
+
+  bucket_paths = [os.path.join(tmpdir, f"bucket-{i}.pickle") for i in range(n_buckets)]
+  with incremental.open_parse_cache(cache_dir) as parse_cache:
+    positions, reflexive_verbs = spill_to_buckets(input_file, bucket_paths, workers, parse_cache)
+  print("finished loading and parsing input file")
+
+  forms_index = None if no_post_process else OnDiskFormsIndex(os.path.join(tmpdir, "forms.sqlite"))
+  largest_neighbourhood = largest_bucket = 0
+  for i, bucket_path in enumerate(bucket_paths):
+    run_paths, neighbourhood_size, bucket_size = process_bucket(bucket_path, tmpdir, i, positions, reflexive_verbs,
+      no_post_process, entries.links, forms_index)
+    entries.add_run(*run_paths)
+    largest_neighbourhood = max(largest_neighbourhood, neighbourhood_size)
+    largest_bucket = max(largest_bucket, bucket_size)
+    os.remove(bucket_path)
+  print(f"largest neighbourhood: {largest_neighbourhood} entries, largest bucket: {largest_bucket} entries")
+
+  if forms_index:
+    forms_index.finish_writing()
+    entries.insert_from_forms_entries(forms_index)
+    forms_index.close()
+
+  return entries, entries.lemma_contributions
+
+
+def neighbourhood(word):
+  """The word whose neighbourhood word is in: its non-reflexive lemma for a -rse verb, else itself.
+  The reflexive merge moves entries from a -rse verb to its lemma, which never ends in -rse itself."""
+  return word[:-2] if word.endswith("rse") else word
+
+
+def spill_to_buckets(input_file, bucket_paths, workers=1, parse_cache=None):
+  """Spills the parsed entries of each input line to the bucket of its neighbourhood. Returns the
+  position each word was loaded at and the verbs the reflexive merge will merge."""
+  positions = {}
+  reflexive_verbs = set()
+  bucket_files = [open(path, 'wb') for path in bucket_paths]
+  try:
+    for entries in parse_input_file(input_file, workers, parse_cache):
+      if not entries:
+        continue
+      for entry in entries:
+        positions.setdefault(entry['word'], len(positions))
+        # the merge takes the reflexive entries out of every -rse verb which has one
+        if process_dictionary.MERGE_REFLEXIVE_VERBS and is_defin_reflexive(entry):
+          reflexive_verbs.add(entry['word'])
+      root = neighbourhood(entries[0]['word'])
+      # entries parsed from the same line share their forms list, and the reflexive merge relies on
+      # that, so they're always pickled together
+      pickle.dump(entries, bucket_files[zlib.crc32(root.encode()) % len(bucket_files)], pickle.HIGHEST_PROTOCOL)
+  finally:
+    for file in bucket_files:
+      file.close()
+  return positions, reflexive_verbs
+
+
+def process_bucket(bucket_path, tmpdir, index, positions, reflexive_verbs, no_post_process, links, forms_index):
+  """Post-processes the neighbourhoods of a bucket and writes them to a sorted run. When post-processing
+  it also writes a run with what the from_forms insertion sweeps over, and adds the FormOfLinks of the
+  entries to links and their forms to forms_index. Returns the paths of the runs and the number of
+  entries in the largest neighbourhood and in the whole bucket."""
+  # neighbourhoods don't affect each other, so the whole bucket is processed at once, unpickled
+  # straight into all_entries_matching_word
+  all_entries_matching_word = defaultdict(list)
+  for line_entries in read_pickles(bucket_path):
+    for entry in line_entries:
+      all_entries_matching_word[entry['word']].append(entry)
+  if not no_post_process:
+    merge_reflexive_entries(all_entries_matching_word)
+    rewrite_entries(all_entries_matching_word, reflexive_verbs)
+
+  records = []
+  sweep_records = []
+  sizes = Counter()
+  for word, entries in all_entries_matching_word.items():
+    order = load_order(word, positions)
+    records.append((order, word, entries))
+    sizes[neighbourhood(word)] += len(entries)
+    if forms_index:
+      links[word] = [FormOfLink(word, entry.get("pos"), entry.get("form_of")) for entry in entries]
+      # only entries with forms can insert anything
+      sweep_records.append((order, word, [(entry.get("pos"), entry.get("form_of"), entry['forms'])
+        for entry in entries if entry.get("forms")]))
+  if forms_index:
+    forms_index.add(FormsIndex(all_entries_matching_word))
+  del all_entries_matching_word
+
+  largest_neighbourhood = max(sizes.values(), default=0)
+  run_path = os.path.join(tmpdir, f"entries-{index}.pickle")
+  write_sorted_run(run_path, records)
+  if not forms_index:
+    return (run_path, None), largest_neighbourhood, sum(sizes.values())
+  sweep_path = os.path.join(tmpdir, f"sweep-{index}.pickle")
+  write_sorted_run(sweep_path, sweep_records)
+  return (run_path, sweep_path), largest_neighbourhood, sum(sizes.values())
+
+
+def load_order(word, positions):
+  """The position of word in all_entries_matching_word after the reflexive merge. The lemmas it creates
+  come after the loaded words, in the order of the -rse verbs they were created for."""
+  position = positions.get(word)
+  return position if position is not None else len(positions) + positions[word + "se"]
+
+
+def write_sorted_run(path, records):
+  records.sort(key=lambda record: record[0])
+  with open(path, 'wb') as file:
+    for record in records:
+      pickle.dump(record, file, pickle.HIGHEST_PROTOCOL)
+
+
+def merge_runs(paths):
+  return heapq.merge(*map(read_pickles, paths), key=lambda record: record[0])
+
+
+def read_pickles(path):
+  with open(path, 'rb') as file:
+    while True:
+      try:
+        yield pickle.load(file)
+      except EOFError:
+        return
+
+
+class FormOfLink:
+  """What the from_forms insertion and the lemma lookups read of an entry: its word, pos and form_of,
+  and while sweeping its forms, with the same get and [] as the entry."""
+
+  __slots__ = ("word", "pos", "form_of", "forms")
+
+  def __init__(self, word, pos, form_of, forms=None):
+    self.word = word
+    self.pos = pos
+    self.form_of = form_of
+    self.forms = forms
+
+  def get(self, key, default=None):
+    value = getattr(self, key, None)
+    return default if value is None else value
+
+  def __getitem__(self, key):
+    return getattr(self, key)
+
+
+class OnDiskFormsIndex:
+  """The FormsIndex of the whole dictionary in sqlite. It's written a bucket at a time with add, and only
+  read after finish_writing, keeping the most recently used forms sets in memory. Most of the words it's
+  asked about don't have forms, so the words which do are kept in memory too."""
+
+  def __init__(self, path):
+    self.db = sqlite3.connect(path)
+    self.db.execute("PRAGMA journal_mode = OFF")
+    self.db.execute("PRAGMA synchronous = OFF")
+    self.db.execute("CREATE TABLE forms (word TEXT NOT NULL, pos TEXT, forms BLOB, PRIMARY KEY (word, pos))")
+    self.words = set()
+    self.forms = functools.lru_cache(maxsize=FORMS_CACHE_SIZE)(self._load_forms)
+
+  def add(self, forms_index):
+    rows = [(word, pos, pickle.dumps(forms, pickle.HIGHEST_PROTOCOL)) for (word, pos), forms in forms_index.items()]
+    self.words.update(word for word, _, _ in rows)
+    self.db.executemany("INSERT INTO forms VALUES (?, ?, ?)", rows)
+
+  def finish_writing(self):
+    self.db.commit()
+
+  def _load_forms(self, word, pos):
+    if word not in self.words:
+      return FormsIndex.EMPTY
+    row = self.db.execute("SELECT forms FROM forms WHERE word = ? AND pos IS ?", (word, pos)).fetchone()
+    return pickle.loads(row[0]) if row else FormsIndex.EMPTY
+
+  def entry_added(self, word, defin):
+    # only called for the entries the from_forms insertion adds, which don't have forms
+    if defin.get("forms"):
+      raise Exception("entries with forms can't be added after the OnDiskFormsIndex is written")
+
+  def close(self):
+    self.forms.cache_clear()
+    self.words.clear()
+    self.db.close()
+
+
+class StreamedEntries:
+  """Post-processed entries spilled to disk in sorted runs, merged back into order when iterated, with
+  the entries the from_forms insertion added to them."""
+
+  def __init__(self, tmpdir):
+    self.runs = []
+    self.sweep_runs = []
+    # word -> a FormOfLink for each of its rewritten entries, followed by the entries inserted by the
+    # from_forms insertion, which is all that's needed for the lemma contributions
+    self.links = defaultdict(list)
+    # every word in the final order, the first `swept` of them are the words in the runs
+    self.words = []
+    self.swept = 0
+    self.lemma_index = None
+    self._cleanup = weakref.finalize(self, shutil.rmtree, tmpdir, True)
+
+  def add_run(self, path, sweep_path=None):
+    self.runs.append(path)
+    if sweep_path:
+      self.sweep_runs.append(sweep_path)
+
+  def insert_from_forms_entries(self, forms_index):
+    """The from_forms insertion over the entries in the runs, in the same order as the in-memory path.
+    Lookups only go to the links and forms_index, and the inserted entries are added to the links."""
+    self.lemma_index = FormOfLemmaIndex(self.links)
+    for _, word, entries in merge_runs(self.sweep_runs):
+      self.words.append(word)
+      for pos, form_of, forms in entries:
+        insert_from_forms_entries(FormOfLink(word, pos, form_of, forms), self.links, self.lemma_index, forms_index)
+    # words it created come after all the others, in the order they were created in
+    self.swept = len(self.words)
+    self.words.extend(islice(self.links, self.swept, None))
+
+  def items(self):
+    for _, word, entries in merge_runs(self.runs):
+      inserted = self.links[word][len(entries):] if self.swept else None
+      yield word, entries + inserted if inserted else entries
+    for word in self.words[self.swept:]:
+      yield word, self.links[word]
+
+  def lemma_contributions(self):
+    return lemma_contributions_by_word(((word, self.links[word]) for word in self.words), self.lemma_index)
+
+  def close(self):
+    self._cleanup()
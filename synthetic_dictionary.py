@@ -0,0 +1,238 @@
+"""Generates a synthetic wiktextract-style Spanish dictionary, with matching CDE and SRG files, for
+benchmarking and checking changes without the real dumps.
+
+The entries are made up but have the shapes post-processing cares about: verbs with forms and form_of
+entries, reflexive -rse verbs (some with the non-reflexive verb only pointing at them), form_of
+entries which wiktextract failed to parse, 'combined with' forms, alt_of senses, multi-token forms and
+form_of chains which end in a lemma, a cycle, a missing word or a different pos.
+
+  python synthetic_dictionary.py --lemmas 20000 --output-dir synthetic/
+"""
+
+import argparse
+import json
+import os
+import random
+
+LETTERS = "abcdefghijlmnoprstuvzáéíóñ"
+VERB_ENDINGS = ["o", "as", "a", "amos", "an", "ando", "ado", "ó", "aba"]
+
+
+class SyntheticDictionary:
+  def __init__(self, seed=1, max_chain_length=6):
+    self.rng = random.Random(seed)
+    self.max_chain_length = max_chain_length
+    self.entries = []
+    self.lemmas = []
+    # (lemma, pos or tag, forms) for the CDE and SRG files
+    self.cde = []
+    self.srg = []
+
+  def stem(self):
+    return "".join(self.rng.choice(LETTERS) for _ in range(self.rng.randint(2, 6)))
+
+  def add_lemma(self):
+    stem = self.stem()
+    kind = self.rng.random()
+    if kind < 0.35:
+      self.add_verb(stem)
+    elif kind < 0.7:
+      self.add_noun(stem)
+    elif kind < 0.8:
+      self.add_adjective(stem)
+    elif kind < 0.88 and len(self.lemmas) > 3:
+      self.add_chain()
+    else:
+      self.add_multi_token(stem)
+
+  def add_verb(self, stem):
+    rng = self.rng
+    infinitive = stem + rng.choice(["ar", "er", "ir"])
+    forms = [stem + ending for ending in VERB_ENDINGS]
+    entry = {"word": infinitive, "pos": "verb", "senses": [
+        {"glosses": ["to " + self.stem()], "raw_glosses": ["(transitive) to " + self.stem() + " (something)"],
+          "tags": rng.choice([[], ["transitive"], ["uncountable"]])},
+        {"glosses": ["to " + self.stem(), "more:"]},
+      ],
+      "forms": [{"form": form, "tags": ["indicative"]} for form in forms] + [
+        {"form": "no " + forms[1], "tags": ["imperative", "negative"]},
+        {"form": "es-conj", "tags": ["table-tags"]},
+        {"form": "-", "tags": ["x"]},
+        {"form": "some meaning", "tags": ["y"]},
+      ],
+      "head_templates": [{"name": "es-verb", "args": {}}]}
+    self.entries.append(entry)
+    self.lemmas.append(infinitive)
+
+    for form in forms[:rng.randint(0, len(forms))]:
+      self.add_verb_form(form, infinitive)
+    self.cde.append((infinitive, "v", forms))
+    self.srg.append((infinitive, "VMN0000", forms))
+
+    if rng.random() < 0.3:
+      self.add_reflexive_verb(stem, infinitive, forms, entry)
+
+  def add_verb_form(self, form, infinitive):
+    kind = self.rng.random()
+    failed_form_of_template = [{"name": "head", "args": {"1": "es", "2": "verb form"}}]
+    if kind < 0.5:
+      self.entries.append({"word": form, "pos": "verb", "senses": [
+        {"glosses": ["first-person singular present indicative of " + infinitive], "form_of": [{"word": infinitive}], "tags": ["form-of"]}]})
+    elif kind < 0.7:
+      self.entries.append({"word": form, "pos": "verb", "senses": [
+        {"glosses": ["inflection of " + infinitive + ":", "first-person singular present indicative"], "form_of": [{"word": infinitive}]},
+        {"glosses": ["inflection of " + infinitive + ":", "third-person singular imperative"], "form_of": [{"word": infinitive}]}]})
+    elif kind < 0.8:
+      # wiktextract didn't find the form_of, it's taken from the gloss
+      self.entries.append({"word": form, "pos": "verb", "head_templates": failed_form_of_template, "senses": [
+        {"glosses": ["first-person singular preterite indicative of " + infinitive]}]})
+    elif kind < 0.85:
+      self.entries.append({"word": form, "pos": "verb", "head_templates": failed_form_of_template, "senses": [
+        {"glosses": ["x", "gerund of " + infinitive + " combined with lo"]},
+        {"glosses": ["y", "infinitive " + infinitive + ", plus"]}]})
+    elif kind < 0.9:
+      self.entries.append({"word": form + "lo", "pos": "verb", "senses": [
+        {"glosses": ["x"], "form_of": [{"word": infinitive + " combined with lo"}]}]})
+    else:
+      self.entries.append({"word": form, "pos": "noun", "senses": [{"glosses": ["a thing"], "tags": ["masculine"]}]})
+
+  def add_reflexive_verb(self, stem, infinitive, forms, entry):
+    rng = self.rng
+    reflexive = infinitive + "se"
+    senses = [
+      {"glosses": ["to " + self.stem() + " oneself"], "raw_glosses": ["(reflexive) to " + self.stem() + " oneself"]},
+      {"glosses": ["to be " + self.stem()]},
+    ]
+    if rng.random() < 0.4:
+      senses.append({"glosses": ["form of " + infinitive], "form_of": [{"word": infinitive}]})
+    self.entries.append({"word": reflexive, "pos": "verb", "senses": senses, "forms": [
+      {"form": "me " + forms[0], "tags": ["t"]},
+      {"form": stem + "ándose", "tags": ["t"]},
+      {"form": "te " + forms[1], "tags": ["t"]},
+    ]})
+    if rng.random() < 0.5:
+      self.entries.append({"word": reflexive, "pos": "verb", "senses": [
+        {"glosses": ["infinitive of " + infinitive + " combined with se"], "form_of": [{"word": infinitive + " combined with se"}]}]})
+    if rng.random() < 0.3:
+      self.entries.append({"word": reflexive, "pos": "noun", "senses": [{"glosses": ["odd noun"]}]})
+    if rng.random() < 0.4:
+      # the non-reflexive verb is only a pointer to the reflexive one
+      self.entries.remove(entry)
+      self.entries.append({"word": infinitive, "pos": "verb", "senses": [
+        {"glosses": ["only used in " + reflexive], "form_of": [{"word": reflexive}]}]})
+      self.entries.append({"word": infinitive, "pos": "verb", "senses": [
+        {"glosses": ["alt of " + reflexive], "form_of": [{"word": reflexive}]}]})
+    for form in forms[:3]:
+      if rng.random() < 0.5:
+        self.entries.append({"word": form + "se", "pos": "verb", "senses": [
+          {"glosses": ["form of " + reflexive], "form_of": [{"word": reflexive}]}]})
+    self.entries.append({"word": "me " + forms[0], "pos": "verb", "senses": [
+      {"glosses": ["form of " + reflexive], "form_of": [{"word": reflexive}]}]})
+
+  def add_noun(self, stem):
+    rng = self.rng
+    noun = stem + rng.choice(["o", "a", "e"])
+    gender = rng.choice([["masculine"], ["feminine"], ["masculine", "feminine"], []])
+    entry = {"word": noun, "pos": rng.choice(["noun", "noun", "name", "num"]), "senses": [
+        {"glosses": ["a " + self.stem()], "raw_glosses": ["(colloquial) a " + self.stem()], "tags": gender},
+        {"glosses": ["(archaic) b " + self.stem() + " (old)"], "tags": gender + rng.choice([[], ["plural-only"]])},
+      ],
+      "forms": [{"form": noun + "s", "tags": ["plural"]}]}
+    if rng.random() < 0.1:
+      entry["head_templates"] = [{"name": "es-noun", "args": {"1": "mfequiv"}}]
+      for sense in entry["senses"]:
+        sense["tags"] = []
+    self.entries.append(entry)
+    self.lemmas.append(noun)
+    if rng.random() < 0.5:
+      self.entries.append({"word": noun + "s", "pos": "noun", "senses": [
+        {"glosses": ["plural of " + noun], "form_of": [{"word": noun}]}]})
+    self.cde.append((noun, "n", [noun + "s"]))
+    self.srg.append((noun, "NCMS000", [noun + "s"]))
+
+  def add_adjective(self, stem):
+    adjective = stem + "o"
+    forms = [stem + "a", stem + "os", stem + "as"]
+    self.entries.append({"word": adjective, "pos": "adj", "senses": [{"glosses": ["red " + self.stem()]}],
+      "forms": [{"form": form, "tags": ["x"]} for form in forms] + [{"form": "el " + stem + "ísimo", "tags": ["superlative"]}]})
+    self.lemmas.append(adjective)
+    for form in forms:
+      if self.rng.random() < 0.6:
+        self.entries.append({"word": form, "pos": "adj", "senses": [
+          {"glosses": ["feminine singular of " + adjective], "form_of": [{"word": adjective}]}]})
+    self.entries.append({"word": stem + "amente", "pos": "adv", "senses": [{"glosses": ["x"]}]})
+    self.cde.append((adjective, "j", forms))
+    self.srg.append((adjective, "AQ0MS0", forms))
+
+  def add_chain(self):
+    # alt_of chain, ending in a cycle, a missing word, a different pos or a lemma
+    rng = self.rng
+    chain = [self.stem() + "x" + str(i) for i in range(rng.randint(2, self.max_chain_length))]
+    for word, target in zip(chain, chain[1:]):
+      self.entries.append({"word": word, "pos": "noun", "senses": [
+        {"glosses": ["alt of " + target], "alt_of": [{"word": target}], "tags": ["alt-of"]}]})
+    end = rng.random()
+    if end < 0.3:
+      self.entries.append({"word": chain[-1], "pos": "noun", "senses": [{"glosses": ["cycle"], "form_of": [{"word": chain[0]}]}]})
+    elif end < 0.6:
+      self.entries.append({"word": chain[-1], "pos": "noun", "senses": [{"glosses": ["dangling"], "form_of": [{"word": "missing" + self.stem()}]}]})
+    elif end < 0.8:
+      self.entries.append({"word": chain[-1], "pos": "verb", "senses": [{"glosses": ["pos mismatch"], "form_of": [{"word": rng.choice(self.lemmas)}]}]})
+    else:
+      self.entries.append({"word": chain[-1], "pos": "noun", "senses": [{"glosses": ["root"]}],
+        "forms": [{"form": chain[-1] + "s", "tags": ["plural"]}, {"form": chain[0], "tags": ["alt"]}]})
+
+  def add_multi_token(self, stem):
+    self.entries.append({"word": stem + " de " + self.stem(), "pos": self.rng.choice(["noun", "phrase", "verb"]),
+      "senses": [{"glosses": ["idiom " + self.stem()]}, {"tags": ["uncountable"]}],
+      "forms": [{"form": stem + "s de x", "tags": ["plural"]}, {"form": stem + "s de x", "tags": ["plural"]}]})
+
+  def write(self, output_dir):
+    """Writes in.jsonl, cde.txt and srg/ (verbs, nouns and verbs-nogros) to output_dir."""
+    rng = self.rng
+    entries = list(self.entries)
+    rng.shuffle(entries)
+    os.makedirs(os.path.join(output_dir, "srg"), exist_ok=True)
+    with open(os.path.join(output_dir, "in.jsonl"), "w") as file:
+      for entry in entries:
+        file.write(json.dumps(entry, ensure_ascii=rng.random() < 0.5) + "\n")
+
+    with open(os.path.join(output_dir, "cde.txt"), "w", encoding="windows-1252") as file:
+      for i in range(8):
+        file.write("header\n")
+      for rank, (lemma, pos, forms) in enumerate(self.cde):
+        for form in [lemma] + forms:
+          lemma_freq, form_freq = rng.randint(1, 999), rng.randint(1, 999)
+          form = form.capitalize() if rng.random() < 0.1 else form
+          file.write(f"{rank} {lemma_freq} {lemma} {pos} {form_freq} {form} x\n")
+
+    for name in ["verbs", "nouns", "verbs-nogros"]:
+      with open(os.path.join(output_dir, "srg", name), "w", encoding="windows-1252") as file:
+        for lemma, tag, forms in self.srg:
+          if (name == "verbs") != (tag[0] == "V"):
+            continue
+          for form in forms:
+            file.write(f"{form} {lemma}{'+se' if rng.random() < 0.1 else ''} {tag}\n")
+
+
+def generate(output_dir, lemmas, seed=1, max_chain_length=6):
+  dictionary = SyntheticDictionary(seed, max_chain_length)
+  for _ in range(lemmas):
+    dictionary.add_lemma()
+  dictionary.write(output_dir)
+  return len(dictionary.entries)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Generate a synthetic wiktextract dictionary with CDE and SRG files.')
+  parser.add_argument('--output-dir', type=str, required=True, help='Directory to write in.jsonl, cde.txt and srg/ to')
+  parser.add_argument('--lemmas', type=int, default=20000, help='Number of lemmas (and their forms) to generate')
+  parser.add_argument('--seed', type=int, default=1, help='Random seed')
+  parser.add_argument('--max-chain-length', type=int, default=6, help='Longest alt_of chain to generate')
+  args = parser.parse_args()
+  entries = generate(args.output_dir, args.lemmas, args.seed, args.max_chain_length)
+  print(f"wrote {entries} entries to {args.output_dir}")
+
+
+if __name__ == "__main__":
+  main()